@@ -1,3 +1,4 @@
 from __future__ import print_function, unicode_literals
 
 __author__ = "danishabdullah"
+__version__ = "1.0.3"
@@ -1,28 +1,37 @@
 from __future__ import print_function, unicode_literals
 
-import re
 from getpass import getuser
 
-from algen.consts import POSTGRES_TYPES, MUTABLE_DICT_TYPES, NO_PARAMS_TYPES
+from algen.consts import MUTABLE_DICT_TYPES, EAGER_STRATEGIES, LARGE_COLUMN_TYPES
+from algen.graph import load_plan
+from algen.ir import build_model_ir, convert_case, get_col_type_info
+from algen.profiling import Phase, profiled
 from algen.templates import ALCHEMY_TEMPLATES
 
 __author__ = "danishabdullah"
 
-TYPE_INFO_REGEX = re.compile("(^\w+)(\(.*\)$)?")
+__all__ = ('MODES', 'ModelCompiler', 'PackageCompiler')
 
-__all__ = ('ModelCompiler',)
+COLUMN_QUOTED_ARGS = {'server_default': '"{}"', 'server_onupdate': '"{}"'}
+RELATIONSHIP_QUOTED_ARGS = {'back_populates': "'{}'", 'lazy': "'{}'"}
+MODES = ('orm', 'core', 'both')
 
 
 class ModelCompiler(object):
     """
     Class for compiling and producing a Sql Alchemy model from user provided definition.
 
-    Everything is implemented as a property for rapid development without any  thought
-    for speed.
+    The definition is normalised once into an immutable ModelIR (see algen.ir) and every
+    compiled_* property renders from it, so compile time grows linearly with the schema.
     """
 
-    def __init__(self, name, column_def):
+    def __init__(self, name, column_def, async_mode=False, mode='orm', cache=False, instrument=False):
         assert isinstance(column_def, dict)
+        assert mode in MODES
+        self.async_mode = async_mode
+        self.mode = mode
+        self.cache = cache
+        self.instrument = instrument
         self.model_def = {'name': column_def}
         self.username = getuser()
         self.tab = '    '
@@ -30,27 +39,18 @@ class ModelCompiler(object):
         self.column_definitions = column_def['columns']
         self.foreign_key_definitions = column_def.get('foreign_keys', [])
         self.relationship_definitions = column_def.get('relationships', [])
+        with Phase('build_ir', name):
+            self.ir = build_model_ir(name, column_def)
 
     @staticmethod
     def convert_case(name):
         """Converts name from CamelCase to snake_case"""
-        s1 = re.sub('(.)([A-Z][a-z]+)', r'\1_\2', name)
-        return re.sub('([a-z0-9])([A-Z])', r'\1_\2', s1).lower()
+        return convert_case(name)
 
     @property
     def table_name(self):
         """Pluralises the class_name using utterly simple algo and returns as table_name"""
-        if not self.class_name:
-            raise ValueError
-        else:
-            tbl_name = ModelCompiler.convert_case(self.class_name)
-        last_letter = tbl_name[-1]
-        if last_letter in ("y",):
-            return "{}ies".format(tbl_name[:-1])
-        elif last_letter in ("s",):
-            return "{}es".format(tbl_name)
-        else:
-            return "{}s".format(tbl_name)
+        return self.ir.table_name
 
     @staticmethod
     def get_column_type(string):
@@ -62,183 +62,264 @@ class ModelCompiler(object):
 
     @staticmethod
     def get_col_type_info(string):
-        for match in TYPE_INFO_REGEX.finditer(string):
-            name, params = match.groups()
-            return name if name else '', params if params else ''
-        return '', ''
+        return get_col_type_info(string)
 
     @property
     def types(self):
-        """All the unique types found in user supplied model"""
-        res = []
-        for column in self.column_definitions:
-            tmp = column.get('type', None)
-            res.append(ModelCompiler.get_column_type(tmp)) if tmp else False
-        res = list(set(res))
-        return res
+        """All the unique types found in user supplied model, in order of first appearance"""
+        return list(self.ir.types)
 
     @property
     def postgres_types(self):
         """Returns known postgres only types referenced in user supplied model"""
-        return [n for n in self.types if n in POSTGRES_TYPES]
+        return list(self.ir.postgres_types)
 
     @property
     def standard_types(self):
         """Returns non-postgres types referenced in user supplied model"""
-        return [n for n in self.types if n not in POSTGRES_TYPES]
+        return list(self.ir.standard_types)
 
     @property
     def basic_types(self):
         """Returns non-postgres types referenced in user supplied model """
-        if not self.foreign_key_definitions:
+        if not self.ir.foreign_keys:
             return self.standard_types
         else:
             tmp = self.standard_types
             tmp.append('ForeignKey')
             return tmp
 
+    @property
+    def core_imports(self):
+        """Returns the sqlalchemy core functions and constructs used by the generated code"""
+        res = ['insert']
+        if len(self.ir.primary_keys) > 1:
+            res.append('tuple_')
+        if self.ir.indexes:
+            res.append('Index')
+        if any(index.expressions or index.where for index in self.ir.indexes):
+            res.append('text')
+        if self.ir.relationships or self.light_columns or self.ir.deferred_groups:
+            res.append('orm')
+        if self.ir.primary_keys:
+            res.extend(('bindparam', 'select'))
+        if self.deferrable_columns:
+            res.append('inspect')
+        return res
+
     @property
     def mutable_dict_types(self):
-        return [n for n in self.types if n in MUTABLE_DICT_TYPES]
+        return list(self.ir.mutable_dict_types)
 
     @property
     def primary_keys(self):
         """Returns the primary keys referenced in user supplied model"""
-        res = []
-        for column in self.column_definitions:
-            if 'primary_key' in column.keys():
-                tmp = column.get('primary_key', None)
-                res.append(column['name']) if tmp else False
-        return res
+        return list(self.ir.primary_keys)
+
+    @staticmethod
+    def compile_args(args, quoted_args):
+        """Returns compiled keyword arguments, quoting the values of the names in quoted_args"""
+        tmp = []
+        for arg_name, arg_val in args:
+            if arg_name in quoted_args:
+                arg_val = quoted_args[arg_name].format(arg_val)
+            tmp.append(ALCHEMY_TEMPLATES.column_arg.safe_substitute(arg_name=arg_name, arg_val=arg_val))
+        return ", ".join(tmp)
+
+    @staticmethod
+    def compile_name_tuple(names):
+        """Returns the source of a tuple literal of the quoted names"""
+        return ModelCompiler.compile_tuple(["'{}'".format(n) for n in names])
+
+    @staticmethod
+    def compile_tuple(items):
+        """Returns the source of a tuple literal of the items"""
+        if len(items) == 1:
+            return "({},)".format(items[0])
+        return "({})".format(", ".join(items))
+
+    @staticmethod
+    def compile_string(value):
+        """Returns the source of a double quoted string literal of value"""
+        return '"{}"'.format(value.replace('\\', '\\\\').replace('"', '\\"'))
+
+    @staticmethod
+    def compile_deferred(column, definition):
+        """Wraps the compiled definition of a deferred column in deferred()"""
+        if not column.deferred:
+            return definition
+        expression = definition.split(" = ", 1)[1]
+        return ALCHEMY_TEMPLATES.deferred_column.safe_substitute(
+            column_name=column.name, column=expression,
+            deferred_args=", group='{}'".format(column.group) if column.group else '')
+
+    @staticmethod
+    def compile_column_type(column):
+        """Returns the (column_type, type_params) pair used by the column templates"""
+        if column.type in MUTABLE_DICT_TYPES:
+            return ALCHEMY_TEMPLATES.mutable_dict_type.safe_substitute(type=column.type,
+                                                                       type_params=column.type_params), ''
+        return column.type, column.type_params
 
     @property
+    @profiled(model_attr='class_name')
     def compiled_named_imports(self):
         """Returns compiled named imports required for the model"""
         res = []
-        if self.postgres_types:
+        if self.ir.postgres_types:
             res.append(
                 ALCHEMY_TEMPLATES.named_import.safe_substitute(
                     module='sqlalchemy.dialects.postgresql',
-                    labels=", ".join(self.postgres_types)))
-        if self.mutable_dict_types:
+                    labels=", ".join(self.ir.postgres_types)))
+        if self.ir.mutable_dict_types:
             res.append(
                 ALCHEMY_TEMPLATES.named_import.safe_substitute(
                     module='sqlalchemy.ext.mutable', labels='MutableDict'
                 ))
+        if self.cached:
+            res.append(ALCHEMY_TEMPLATES.named_import.safe_substitute(
+                module='.alchemy_cache', labels='MISSING, get_backend, invalidate, invalidate_on_commit, is_pending'))
+        if self.instrument:
+            res.append(ALCHEMY_TEMPLATES.named_import.safe_substitute(module='.alchemy_metrics', labels='register'))
+        if self.ir.partition and self.ir.partition.strategy == 'range':
+            res.append(ALCHEMY_TEMPLATES.named_import.safe_substitute(module='datetime', labels='timedelta'))
         return "\n".join(res)
 
     @property
+    @profiled(model_attr='class_name')
     def compiled_orm_imports(self):
         """Returns compiled named imports required for the model"""
         module = 'sqlalchemy.orm'
         labels = []
-        if self.relationship_definitions:
+        if self.ir.relationships:
             labels.append("relationship")
+        if any(c.deferred for c in self.ir.columns + self.ir.foreign_keys):
+            labels.append("deferred")
+        if not labels:
+            return ''
         return ALCHEMY_TEMPLATES.named_import.safe_substitute(module=module, labels=", ".join(labels))
 
     @property
+    @profiled(model_attr='class_name')
     def compiled_columns(self):
         """Returns compiled column definitions"""
-
-        def get_column_args(column):
-            tmp = []
-            for arg_name, arg_val in column.items():
-                if arg_name not in ('name', 'type'):
-                    if arg_name in ('server_default', 'server_onupdate'):
-                        arg_val = '"{}"'.format(arg_val)
-                    tmp.append(ALCHEMY_TEMPLATES.column_arg.safe_substitute(arg_name=arg_name,
-                                                                            arg_val=arg_val))
-            return ", ".join(tmp)
-
         res = []
-        for column in self.column_definitions:
-            column_args = get_column_args(column)
-            column_type, type_params = ModelCompiler.get_col_type_info(column.get('type'))
-            column_name = column.get('name')
-            if column_type in MUTABLE_DICT_TYPES:
-                column_type = ALCHEMY_TEMPLATES.mutable_dict_type.safe_substitute(type=column_type,
-                                                                                  type_params=type_params)
-                type_params = ''
-            res.append(
-                ALCHEMY_TEMPLATES.column_definition.safe_substitute(column_name=column_name,
-                                                                    column_type=column_type,
-                                                                    column_args=column_args,
-                                                                    type_params=type_params))
+        for column in self.ir.columns:
+            column_type, type_params = ModelCompiler.compile_column_type(column)
+            res.append(ModelCompiler.compile_deferred(column, ALCHEMY_TEMPLATES.column_definition.safe_substitute(
+                column_name=column.name,
+                column_type=column_type,
+                column_args=ModelCompiler.compile_args(column.args, COLUMN_QUOTED_ARGS),
+                type_params=type_params)))
         join_string = "\n" + self.tab
         return join_string.join(res)
 
     @property
+    @profiled(model_attr='class_name')
     def compiled_foreign_keys(self):
         """Returns compiled foreign key definitions"""
-
-        def get_column_args(column):
-            tmp = []
-            for arg_name, arg_val in column.items():
-                if arg_name not in ('name', 'type', 'reference'):
-                    if arg_name in ('server_default', 'server_onupdate'):
-                        arg_val = '"{}"'.format(arg_val)
-                    tmp.append(ALCHEMY_TEMPLATES.column_arg.safe_substitute(arg_name=arg_name,
-                                                                            arg_val=arg_val))
-            return ", ".join(tmp)
-
-        def get_fkey_args(column):
-            table = column['reference']['table']
-            column = column['reference']['column']
-            return ALCHEMY_TEMPLATES.foreign_key_arg.safe_substitute(reference_table=table, reference_column=column)
-
         res = []
-        for column in self.foreign_key_definitions:
-            column_args = get_column_args(column)
-            column_type, type_params = ModelCompiler.get_col_type_info(column.get('type'))
-            column_name = column.get('name')
-            reference = get_fkey_args(column)
-            if column_type in MUTABLE_DICT_TYPES:
-                column_type = ALCHEMY_TEMPLATES.mutable_dict_type.safe_substitute(type=column_type,
-                                                                                  type_params=type_params)
-                type_params = ''
-            res.append(
-                ALCHEMY_TEMPLATES.foreign_key.safe_substitute(column_name=column_name,
-                                                              column_type=column_type,
-                                                              column_args=column_args,
-                                                              foreign_key_args=reference,
-                                                              type_params=type_params))
+        for column in self.ir.foreign_keys:
+            column_type, type_params = ModelCompiler.compile_column_type(column)
+            reference = ALCHEMY_TEMPLATES.foreign_key_arg.safe_substitute(reference_table=column.reference.table,
+                                                                          reference_column=column.reference.column)
+            res.append(ModelCompiler.compile_deferred(column, ALCHEMY_TEMPLATES.foreign_key.safe_substitute(
+                column_name=column.name,
+                column_type=column_type,
+                column_args=ModelCompiler.compile_args(column.args, COLUMN_QUOTED_ARGS),
+                foreign_key_args=reference,
+                type_params=type_params)))
         join_string = "\n" + self.tab
         return join_string.join(res)
 
     @property
+    @profiled(model_attr='class_name')
     def compiled_relationships(self):
         """Returns compiled relationship definitions"""
-
-        def get_column_args(column):
-            tmp = []
-            for arg_name, arg_val in column.items():
-                if arg_name not in ('name', 'type', 'reference', 'class'):
-                    if arg_name in ('back_populates', ):
-                        arg_val = "'{}'".format(arg_val)
-                    tmp.append(ALCHEMY_TEMPLATES.column_arg.safe_substitute(arg_name=arg_name,
-                                                                            arg_val=arg_val))
-            return ", ".join(tmp)
-
         res = []
-        for column in self.relationship_definitions:
-            column_args = get_column_args(column)
-            column_name = column.get('name')
-            cls_name = column.get("class")
+        for relationship in self.ir.relationships:
+            args = relationship.args
+            if self.async_mode and 'lazy' not in dict(args):
+                # lazy loads are implicit IO which fails outside of greenlet_spawn under asyncio
+                args += (('lazy', 'selectin'),)
             res.append(
-                ALCHEMY_TEMPLATES.relationship.safe_substitute(column_name=column_name,
-                                                               column_args=column_args,
-                                                               class_name=cls_name))
+                ALCHEMY_TEMPLATES.relationship.safe_substitute(
+                    column_name=relationship.name,
+                    column_args=ModelCompiler.compile_args(args, RELATIONSHIP_QUOTED_ARGS),
+                    class_name=relationship.class_name))
         join_string = "\n" + self.tab
         return join_string.join(res)
 
+    @property
+    @profiled(model_attr='class_name')
+    def compiled_indexes(self):
+        """Returns compiled Index definitions for __table_args__"""
+        res = []
+        for index in self.ir.indexes:
+            args = ["'{}'".format(n) for n in index.columns]
+            args.extend(ALCHEMY_TEMPLATES.text_clause.safe_substitute(sql=ModelCompiler.compile_string(expression))
+                        for expression in index.expressions)
+            if index.unique:
+                args.append("unique=True")
+            if index.where:
+                args.append("postgresql_where={}".format(
+                    ALCHEMY_TEMPLATES.text_clause.safe_substitute(sql=ModelCompiler.compile_string(index.where))))
+            if index.using:
+                args.append("postgresql_using='{}'".format(index.using))
+            if index.ops:
+                args.append("postgresql_ops={{{}}}".format(", ".join("'{}': '{}'".format(*op) for op in index.ops)))
+            res.append(ALCHEMY_TEMPLATES.index.safe_substitute(index_name=index.name, index_args=", ".join(args)))
+        return res
+
+    @property
+    @profiled(model_attr='class_name')
+    def compiled_table_args(self):
+        """Returns compiled __table_args__, or nothing when the model doesn't need any"""
+        entries = self.compiled_indexes
+        if self.ir.partition:
+            # keyword arguments go in a dict which must be the last entry
+            entries.append(ALCHEMY_TEMPLATES.partition_by.safe_substitute(
+                strategy=self.ir.partition.strategy.upper(), column=self.ir.partition.column))
+        if not entries:
+            return ''
+        join_string = ",\n" + self.tab + self.tab
+        return ALCHEMY_TEMPLATES.table_args.safe_substitute(table_arg_entries=join_string.join(entries))
+
+    @property
+    @profiled(model_attr='class_name')
+    def compiled_eager_options(self):
+        """Returns compiled <Model>EagerOptions class with a with_<relationship> option set per
+        relationship, one per user declared load_options set and with_all"""
+        if not self.ir.relationships:
+            return ''
+        defaults = {r.name: r.lazy if r.lazy in EAGER_STRATEGIES else 'selectin' for r in self.ir.relationships}
+
+        def get_option(path):
+            return "{}EagerOptions.path('{}', strategy or '{}')".format(self.class_name, path,
+                                                                        defaults[path.split('.')[0]])
+
+        option_sets = [("with_{}".format(r.name), (r.name,)) for r in self.ir.relationships]
+        option_sets.extend(self.ir.load_options)
+        option_sets.append(("with_all", tuple(r.name for r in self.ir.relationships)))
+        compiled_sets = "\n".join(
+            ALCHEMY_TEMPLATES.load_option_set.safe_substitute(
+                set_name=set_name, options=ModelCompiler.compile_tuple([get_option(p) for p in paths]))
+            for set_name, paths in option_sets)
+        return ALCHEMY_TEMPLATES.eager_cls.safe_substitute(class_name=self.class_name, option_sets=compiled_sets)
+
     @property
     def columns(self):
         """Return names of all the addressable columns (including foreign keys) referenced in user supplied model"""
-        res = [col['name'] for col in self.column_definitions]
-        res.extend([col['name'] for col in self.foreign_key_definitions])
-        return res
+        return list(self.ir.column_names)
+
+    @property
+    def updatable_columns(self):
+        """Return names of all the addressable columns which aren't primary keys"""
+        primary_keys = frozenset(self.ir.primary_keys)
+        return [n for n in self.ir.column_names if n not in primary_keys]
 
     @property
+    @profiled(model_attr='class_name')
     def compiled_init_func(self):
         """Returns compiled init function"""
 
@@ -249,12 +330,25 @@ class ModelCompiler(object):
             return ALCHEMY_TEMPLATES.func_arg.safe_substitute(arg_name=arg_name)
 
         join_string = "\n" + self.tab + self.tab
-        column_assignments = join_string.join([get_column_assignment(n) for n in self.columns])
-        init_args = ", ".join(get_compiled_args(n) for n in self.columns)
+        column_assignments = join_string.join([get_column_assignment(n) for n in self.ir.column_names])
+        init_args = ", ".join(get_compiled_args(n) for n in self.ir.column_names)
         return ALCHEMY_TEMPLATES.init_function.safe_substitute(col_assignments=column_assignments,
                                                                init_args=init_args)
 
     @property
+    @profiled(model_attr='class_name')
+    def compiled_add_func(self):
+        """Returns compiled add function"""
+        return ALCHEMY_TEMPLATES.add_function.safe_substitute(invalidate_cached=self.invalidate_cached)
+
+    @property
+    @profiled(model_attr='class_name')
+    def compiled_delete_func(self):
+        """Returns compiled delete function"""
+        return ALCHEMY_TEMPLATES.delete_function.safe_substitute(invalidate_cached=self.invalidate_cached)
+
+    @property
+    @profiled(model_attr='class_name')
     def compiled_update_func(self):
         """Returns compiled update function"""
 
@@ -264,15 +358,17 @@ class ModelCompiler(object):
         def get_compiled_args(arg_name):
             return ALCHEMY_TEMPLATES.func_arg.safe_substitute(arg_name=arg_name)
 
-        join_string = "\n" + self.tab + self.tab
-        columns = [n for n in self.columns if n not in self.primary_keys]
-        not_none_col_assignments = join_string.join([get_not_none_col_assignment(n) for n in columns])
+        columns = self.updatable_columns
+        # a blank line before every assignment
+        not_none_col_assignments = "".join("\n" + get_not_none_col_assignment(n) for n in columns)
         update_args = ", ".join(get_compiled_args(n) for n in columns)
         return ALCHEMY_TEMPLATES.update_function.safe_substitute(not_none_col_assignments=not_none_col_assignments,
+                                                                 invalidate_cached=self.invalidate_cached,
                                                                  update_args=update_args,
                                                                  class_name=self.class_name)
 
     @property
+    @profiled(model_attr='class_name')
     def compiled_hash_func(self):
         """Returns compiled hash function based on hash of stringified primary_keys.
         This isn't the most efficient way"""
@@ -280,7 +376,7 @@ class ModelCompiler(object):
         def get_primary_key_str(pkey_name):
             return "str(self.{})".format(pkey_name)
 
-        hash_str = "+ ".join([get_primary_key_str(n) for n in self.primary_keys])
+        hash_str = "+ ".join([get_primary_key_str(n) for n in self.ir.primary_keys])
         return ALCHEMY_TEMPLATES.hash_function.safe_substitute(concated_primary_key_strs=hash_str)
 
     def comparator_compiler(self, negation_type):
@@ -290,18 +386,20 @@ class ModelCompiler(object):
         assert negation_type in ('positive', 'negative')
         negation_marker = "not " if negation_type == 'negative' else ""
         func_name = "__neq__" if negation_type == 'negative' else "__eq__"
-        key_comparators = [get_primary_key_comparator(n) for n in self.primary_keys]
+        key_comparators = [get_primary_key_comparator(n) for n in self.ir.primary_keys]
         key_comparators = " and ".join(key_comparators)
         return ALCHEMY_TEMPLATES.comparator_function.safe_substitute(func_name=func_name,
                                                                      negation_marker=negation_marker,
                                                                      key_col_comparisons=key_comparators)
 
     @property
+    @profiled(model_attr='class_name')
     def compiled_eq_func(self):
         """Returns compiled equality function"""
         return self.comparator_compiler('positive')
 
     @property
+    @profiled(model_attr='class_name')
     def compiled_neq_func(self):
         return self.comparator_compiler('negative')
 
@@ -314,8 +412,8 @@ class ModelCompiler(object):
         def get_col_evaluator(col):
             return ALCHEMY_TEMPLATES.col_evaluator.safe_substitute(col=col)
 
-        col_evaluators = ", ".join([get_col_evaluator(n) for n in self.primary_keys])
-        col_accessors = ", ".join([get_col_accessor(n) for n in self.primary_keys])
+        col_evaluators = ", ".join([get_col_evaluator(n) for n in self.ir.primary_keys])
+        col_accessors = ", ".join([get_col_accessor(n) for n in self.ir.primary_keys])
 
         return ALCHEMY_TEMPLATES.representor_function.safe_substitute(func_name=func_name,
                                                                       col_accessors=col_accessors,
@@ -323,48 +421,442 @@ class ModelCompiler(object):
                                                                       class_name=self.class_name)
 
     @property
+    @profiled(model_attr='class_name')
     def compiled_str_func(self):
         """Returns compiled __str__ function"""
         return self.representation_function_compiler('str')
 
     @property
+    @profiled(model_attr='class_name')
     def compiled_unicode_func(self):
         """Return compiled __unicode__ function"""
         return self.representation_function_compiler('unicode')
 
     @property
+    @profiled(model_attr='class_name')
     def compiled_repr_func(self):
         """Returns compiled __repr__ function"""
         return self.representation_function_compiler('repr')
 
+    def compile_key_columns(self, owner='cls'):
+        """Returns the source of the primary key columns of owner, as a tuple_ when composite"""
+        columns = ", ".join("{}.{}".format(owner, n) for n in self.ir.primary_keys)
+        if len(self.ir.primary_keys) > 1:
+            return "tuple_({})".format(columns)
+        return columns
+
+    @property
+    @profiled(model_attr='class_name')
+    def compiled_iter_all_func(self):
+        """Returns compiled keyset paginated iter_all function. Requires primary keys"""
+        if not self.ir.primary_keys:
+            return ''
+        if len(self.ir.primary_keys) > 1:
+            keyset_condition = "{} > tuple_(*last_key)".format(self.compile_key_columns())
+        else:
+            keyset_condition = "cls.{} > last_key[0]".format(self.ir.primary_keys[0])
+        return ALCHEMY_TEMPLATES.iter_all_function.safe_substitute(
+            class_name=self.class_name,
+            keyset_condition=keyset_condition,
+            order_by=", ".join("cls.{}".format(n) for n in self.ir.primary_keys),
+            last_key=ModelCompiler.compile_tuple(["last.{}".format(n) for n in self.ir.primary_keys]))
+
+    @property
+    def light_columns(self):
+        """Returns the names of the columns loaded by light(), nothing when light() wouldn't skip any column"""
+        columns = self.ir.columns + self.ir.foreign_keys
+        res = [c.name for c in columns if not c.deferred and c.type not in LARGE_COLUMN_TYPES]
+        if len(res) == len(columns):
+            return []
+        return res
+
+    @property
+    def deferrable_columns(self):
+        """Returns the names of the columns an instance may not have loaded, i.e. the deferred and large ones"""
+        columns = self.ir.columns + self.ir.foreign_keys
+        light_columns = self.light_columns
+        if not light_columns:
+            return [c.name for c in columns if c.deferred]
+        return [c.name for c in columns if c.name not in light_columns]
+
     @property
+    @profiled(model_attr='class_name')
+    def compiled_light_funcs(self):
+        """Returns compiled light loader option, and with_group when the model has deferred column groups"""
+        res = []
+        light_columns = self.light_columns
+        if light_columns:
+            res.append(ALCHEMY_TEMPLATES.light_function.safe_substitute(
+                class_name=self.class_name,
+                light_columns=", ".join("cls.{}".format(n) for n in light_columns)))
+        if self.ir.deferred_groups:
+            res.append(ALCHEMY_TEMPLATES.with_group_function.safe_substitute(
+                groups=", ".join(self.ir.deferred_groups)))
+        return "\n".join(res)
+
+    @property
+    @profiled(model_attr='class_name')
+    def compiled_partition_ddl_func(self):
+        """Returns compiled partition_ddl function for the partitioning strategy of the model"""
+        partition = self.ir.partition
+        if not partition:
+            return ''
+        template = getattr(ALCHEMY_TEMPLATES, "{}_partition_ddl_function".format(partition.strategy))
+        return template.safe_substitute(class_name=self.class_name, table_name=self.ir.table_name,
+                                        column=partition.column)
+
+    @property
+    def cached(self):
+        """True when the read-through cache is generated, which requires primary keys"""
+        return bool(self.cache and self.ir.primary_keys)
+
+    @property
+    def invalidate_cached(self):
+        """Returns the statement invalidating the cached proxy that add, update and delete end with"""
+        return "\n" + self.tab + self.tab + "self.invalidate_cached()" if self.cached else ''
+
+    @property
+    @profiled(model_attr='class_name')
+    def compiled_cache_funcs(self):
+        """Returns compiled cache_key, invalidate_cached, get_cached and cache_clear, when cached"""
+        if not self.cached:
+            return ''
+        substitutions = self.key_lookup_substitutions
+        obj_key = substitutions['obj_key'].replace('obj.', 'self.')
+        return "\n".join((
+            ALCHEMY_TEMPLATES.cache_key_function.safe_substitute(
+                obj_key=obj_key, pk_missing="None in pk" if len(self.ir.primary_keys) > 1 else "pk is None"),
+            ALCHEMY_TEMPLATES.get_cached_function.safe_substitute(
+                class_name=self.class_name, load_deferred='load_deferred=True' if self.deferrable_columns else '')))
+
+    @property
+    def key_lookup_substitutions(self):
+        """Returns the template substitutions shared by the batched primary key lookups"""
+        primary_keys = self.ir.primary_keys
+        composite = len(primary_keys) > 1
+        return dict(
+            in_condition="{}.in_(bindparam('pks', expanding=True))".format(self.compile_key_columns()),
+            key_columns=", ".join("cls.{}".format(n) for n in primary_keys),
+            pk_condition=", ".join("cls.{0} == bindparam('{0}')".format(n) for n in primary_keys),
+            pk_params="dict(zip(cls.PRIMARY_KEY_NAMES, pk))" if composite else "{{'{}': pk}}".format(primary_keys[0]),
+            pk_bind_condition=", ".join("cls.{0} == bindparam('pk_{0}')".format(n) for n in primary_keys),
+            pk_bind_params="{{{}}}".format(", ".join("'pk_{}': pk{}".format(n, "[{}]".format(i) if composite else '')
+                                                    for i, n in enumerate(primary_keys))),
+            pk_ident="pk" if composite else "[pk]",
+            obj_key=ModelCompiler.compile_tuple(["obj.{}".format(n) for n in primary_keys])
+            if composite else "obj.{}".format(primary_keys[0]),
+            row_key="tuple(row)" if composite else "row[0]")
+
+    @property
+    @profiled(model_attr='class_name')
+    def compiled_get_many_funcs(self):
+        """Returns compiled get_many, exists_many, exists, their identity map lookup and the statements they
+        reuse. Requires primary keys"""
+        if not self.ir.primary_keys:
+            return ''
+        substitutions = self.key_lookup_substitutions
+        return "\n".join(template.safe_substitute(**substitutions) for template in (
+            ALCHEMY_TEMPLATES.identity_map_lookup_function,
+            ALCHEMY_TEMPLATES.get_many_function,
+            ALCHEMY_TEMPLATES.exists_many_function,
+            ALCHEMY_TEMPLATES.exists_function,
+            ALCHEMY_TEMPLATES.statement_function,
+            ALCHEMY_TEMPLATES.key_statements_function))
+
+    @property
+    @profiled(model_attr='class_name')
+    def compiled_by_pk_funcs(self):
+        """Returns compiled update_by_pk and delete_by_pk. Requires primary keys"""
+        if not self.ir.primary_keys:
+            return ''
+        invalidate_by_pk = ''
+        if self.cached:
+            invalidate_by_pk = "\n" + self.tab + self.tab + "invalidate_on_commit(session, cls.__tablename__, pk)"
+        return "\n".join(template.safe_substitute(class_name=self.class_name, invalidate_by_pk=invalidate_by_pk,
+                                                  **self.key_lookup_substitutions)
+                         for template in (ALCHEMY_TEMPLATES.update_by_pk_function,
+                                          ALCHEMY_TEMPLATES.delete_by_pk_function))
+
+    @property
+    @profiled(model_attr='class_name')
+    def compiled_async_funcs(self):
+        """Returns compiled AsyncSession coroutines, in async mode only. The primary key lookups
+        require primary keys"""
+        if not self.async_mode:
+            return ''
+        templates = [ALCHEMY_TEMPLATES.async_add_function, ALCHEMY_TEMPLATES.async_delete_function]
+        if self.ir.primary_keys:
+            templates.extend((ALCHEMY_TEMPLATES.async_get_function, ALCHEMY_TEMPLATES.async_get_many_function,
+                              ALCHEMY_TEMPLATES.async_exists_function, ALCHEMY_TEMPLATES.async_exists_many_function))
+        templates.append(ALCHEMY_TEMPLATES.async_bulk_insert_function)
+        substitutions = self.key_lookup_substitutions if self.ir.primary_keys else {}
+        return "\n".join(template.safe_substitute(class_name=self.class_name, invalidate_cached=self.invalidate_cached,
+                                                  **substitutions)
+                         for template in templates)
+
+    @property
+    @profiled(model_attr='class_name')
+    def compiled_to_dict_func(self):
+        """Returns compiled to_dict function reading the columns in schema order, skipping unloaded deferred ones"""
+        if self.deferrable_columns:
+            return "\n".join((
+                ALCHEMY_TEMPLATES.unloaded_columns_function.safe_substitute(
+                    deferrable_columns=ModelCompiler.compile_name_tuple(self.deferrable_columns)),
+                ALCHEMY_TEMPLATES.deferrable_to_dict_function.template))
+        dict_items = ", ".join("'{0}': self.{0}".format(n) for n in self.ir.column_names)
+        return ALCHEMY_TEMPLATES.to_dict_function.safe_substitute(dict_items=dict_items)
+
+    @property
+    @profiled(model_attr='class_name')
+    def compiled_to_row_func(self):
+        """Returns compiled to_row function returning the columns as a tuple in schema order"""
+        if self.deferrable_columns:
+            return ALCHEMY_TEMPLATES.deferrable_to_row_function.template
+        row_tuple = ModelCompiler.compile_tuple(["self.{}".format(n) for n in self.ir.column_names])
+        return ALCHEMY_TEMPLATES.to_row_function.safe_substitute(row_tuple=row_tuple)
+
+    @property
+    @profiled(model_attr='class_name')
+    def compiled_proxy_cls(self):
+        """Returns compiled module level proxy namedtuple with the columns in schema order"""
+        return ALCHEMY_TEMPLATES.proxy_cls.safe_substitute(class_name=self.class_name,
+                                                           proxy_fields=ModelCompiler.compile_name_tuple(
+                                                               self.ir.column_names))
+
+    @property
+    @profiled(model_attr='class_name')
     def compiled_proxy_cls_func(self):
         """Returns compile get_proxy_cls function"""
         return ALCHEMY_TEMPLATES.get_proxy_cls_function.safe_substitute(class_name=self.class_name)
 
     @property
+    @profiled(model_attr='class_name')
+    def compiled_to_proxy_func(self):
+        """Returns compiled to_proxy function"""
+        if self.deferrable_columns:
+            return ALCHEMY_TEMPLATES.deferrable_to_proxy_function.safe_substitute(class_name=self.class_name)
+        return ALCHEMY_TEMPLATES.to_proxy_function.safe_substitute(
+            class_name=self.class_name,
+            self_col_accessors=", ".join("self.{}".format(n) for n in self.ir.column_names))
+
+    @property
+    @profiled(model_attr='class_name')
+    def compiled_to_proxies_func(self):
+        """Returns compiled to_proxies function"""
+        if self.deferrable_columns:
+            return ALCHEMY_TEMPLATES.deferrable_to_proxies_function.safe_substitute(class_name=self.class_name)
+        return ALCHEMY_TEMPLATES.to_proxies_function.safe_substitute(
+            class_name=self.class_name,
+            obj_col_accessors=", ".join("obj.{}".format(n) for n in self.ir.column_names))
+
+    @property
+    @profiled(model_attr='class_name')
+    def compiled_table(self):
+        """Returns compiled core Table definition with the columns, indexes and partitioning"""
+        entries = []
+        for column in self.ir.columns:
+            entries.append(ALCHEMY_TEMPLATES.core_column.safe_substitute(
+                column_name=column.name,
+                column_type=column.type,
+                column_args=ModelCompiler.compile_args(column.args, COLUMN_QUOTED_ARGS),
+                type_params=column.type_params))
+        for column in self.ir.foreign_keys:
+            entries.append(ALCHEMY_TEMPLATES.core_foreign_key.safe_substitute(
+                column_name=column.name,
+                column_type=column.type,
+                column_args=ModelCompiler.compile_args(column.args, COLUMN_QUOTED_ARGS),
+                foreign_key_args=ALCHEMY_TEMPLATES.foreign_key_arg.safe_substitute(
+                    reference_table=column.reference.table, reference_column=column.reference.column),
+                type_params=column.type_params))
+        entries.extend(self.compiled_indexes)
+        if self.ir.partition:
+            entries.append(ALCHEMY_TEMPLATES.core_partition_by.safe_substitute(
+                strategy=self.ir.partition.strategy.upper(), column=self.ir.partition.column))
+        join_string = ",\n" + self.tab
+        return ALCHEMY_TEMPLATES.table.safe_substitute(table_name=self.ir.table_name,
+                                                       table_entries=join_string.join(entries))
+
+    @property
+    @profiled(model_attr='class_name')
+    def compiled_record_cls(self):
+        """Returns compiled slotted <Model>Record class with the column indexes resolved at compile time"""
+        column_names = self.ir.column_names
+        join_string = "\n" + self.tab + self.tab
+        return ALCHEMY_TEMPLATES.record_cls.safe_substitute(
+            class_name=self.class_name,
+            table_name=self.ir.table_name,
+            column_names=ModelCompiler.compile_name_tuple(column_names),
+            column_indexes=", ".join("'{}': {}".format(n, i) for i, n in enumerate(column_names)),
+            init_args=", ".join(ALCHEMY_TEMPLATES.func_arg.safe_substitute(arg_name=n) for n in column_names),
+            col_assignments=join_string.join(ALCHEMY_TEMPLATES.col_assignment.safe_substitute(col_name=n)
+                                             for n in column_names),
+            row_items=", ".join("row[{}]".format(i) for i in range(len(column_names))),
+            dict_items=", ".join("'{0}': self.{0}".format(n) for n in column_names),
+            row_tuple=ModelCompiler.compile_tuple(["self.{}".format(n) for n in column_names]))
+
+    @property
+    def compiled_core_definitions(self):
+        """Returns the core table alias and the record class following the orm class in both mode"""
+        if self.mode != 'both':
+            return ''
+        return ALCHEMY_TEMPLATES.table_alias.safe_substitute(
+            class_name=self.class_name, table_name=self.ir.table_name) + self.compiled_record_cls
+
+    @property
+    @profiled(model_attr='class_name')
+    def compiled_instrumentation(self):
+        """Returns the registration of the model with alchemy_metrics, with the instrument option only"""
+        if not self.instrument:
+            return ''
+        if self.mode == 'core':
+            return ALCHEMY_TEMPLATES.instrumentation.safe_substitute(
+                class_name=self.class_name, metrics=' and row counts', table="{}_table".format(self.ir.table_name),
+                mapped='')
+        return ALCHEMY_TEMPLATES.instrumentation.safe_substitute(
+            class_name=self.class_name, metrics=", row counts, loaded rows, lazy loads and flush sizes",
+            table="{}.__table__".format(self.class_name), mapped=", {}".format(self.class_name))
+
+    @property
+    @profiled(model_attr='class_name')
+    def compiled_core_module(self):
+        """Returns compiled core only module with the Table and the record class"""
+        types = self.basic_types
+        if self.ir.indexes:
+            types.append('Index')
+        if any(index.expressions or index.where for index in self.ir.indexes):
+            types.append('text')
+        named_imports = []
+        if self.ir.postgres_types:
+            named_imports.append(ALCHEMY_TEMPLATES.named_import.safe_substitute(
+                module='sqlalchemy.dialects.postgresql', labels=", ".join(self.ir.postgres_types)))
+        if self.instrument:
+            named_imports.append(ALCHEMY_TEMPLATES.named_import.safe_substitute(module='.alchemy_metrics',
+                                                                                labels='register'))
+        return ALCHEMY_TEMPLATES.core.safe_substitute(types=", ".join(types),
+                                                      named_imports="".join("\n" + i for i in named_imports),
+                                                      username=self.username,
+                                                      table_definition=self.compiled_table,
+                                                      record_cls=self.compiled_record_cls,
+                                                      instrumentation=self.compiled_instrumentation)
+
+    @property
+    @profiled(model_attr='class_name')
     def compiled_model(self):
-        """Returns compile ORM class for the user supplied model"""
+        """Returns compiled ORM class for the user supplied model, or the core module in core mode"""
+        if self.mode == 'core':
+            return self.compiled_core_module
         return ALCHEMY_TEMPLATES.model.safe_substitute(class_name=self.class_name,
-                                                       table_name=self.table_name,
-                                                       column_definitions=self.compiled_columns,
-                                                       init_function=self.compiled_init_func,
-                                                       update_function=self.compiled_update_func,
-                                                       hash_function=self.compiled_hash_func,
-                                                       eq_function=self.compiled_eq_func,
-                                                       neq_function=self.compiled_neq_func,
-                                                       str_function=self.compiled_str_func,
-                                                       unicode_function=self.compiled_unicode_func,
-                                                       repr_function=self.compiled_repr_func,
-                                                       types=", ".join(self.basic_types),
+                                                       table_name=self.ir.table_name,
+                                                       table_args=self.compiled_table_args,
+                                                       class_body=self.compiled_class_body,
+                                                       types=", ".join(self.basic_types + self.core_imports),
                                                        username=self.username,
-                                                       foreign_keys=self.compiled_foreign_keys,
-                                                       relationships=self.compiled_relationships,
-                                                       named_imports=self.compiled_named_imports,
-                                                       orm_imports=self.compiled_orm_imports,
-                                                       get_proxy_cls_function=self.compiled_proxy_cls_func,
-                                                       add_function=ALCHEMY_TEMPLATES.add_function.template,
-                                                       delete_function=ALCHEMY_TEMPLATES.delete_function.template,
-                                                       to_dict_function=ALCHEMY_TEMPLATES.to_dict_function.template,
-                                                       to_proxy_function=ALCHEMY_TEMPLATES.to_proxy_function.template,
-                                                       from_proxy_function=ALCHEMY_TEMPLATES.from_proxy_function.template)
+                                                       eager_options=self.compiled_eager_options,
+                                                       core_definitions=self.compiled_core_definitions,
+                                                       instrumentation=self.compiled_instrumentation,
+                                                       imports=self.compiled_imports,
+                                                       proxy_cls=self.compiled_proxy_cls,
+                                                       column_names=ModelCompiler.compile_name_tuple(
+                                                           self.ir.column_names),
+                                                       primary_key_names=ModelCompiler.compile_name_tuple(
+                                                           self.ir.primary_keys),
+                                                       updatable_column_names=ModelCompiler.compile_name_tuple(
+                                                           self.updatable_columns))
+
+    @property
+    def compiled_imports(self):
+        """Returns the orm and named imports following the sqlalchemy ones, each on its own line"""
+        imports = (self.compiled_orm_imports, self.compiled_named_imports)
+        return "".join("\n" + line for line in imports if line)
+
+    @property
+    def compiled_class_body(self):
+        """Returns the body of the orm class following its constants, the non-empty sections joined in order"""
+        columns = self.compiled_columns
+        foreign_keys = self.compiled_foreign_keys
+        relationships = self.compiled_relationships
+        sections = [
+            ALCHEMY_TEMPLATES.class_section.safe_substitute(section=columns) if columns else '',
+            ALCHEMY_TEMPLATES.foreign_keys_section.safe_substitute(foreign_keys=foreign_keys) if foreign_keys else '',
+            ALCHEMY_TEMPLATES.relationships_section.safe_substitute(
+                relationships=relationships) if relationships else '',
+            self.compiled_init_func,
+            self.compiled_add_func,
+            self.compiled_update_func,
+            self.compiled_delete_func,
+            ALCHEMY_TEMPLATES.bulk_params_function.template,
+            ALCHEMY_TEMPLATES.bulk_insert_function.template,
+            ALCHEMY_TEMPLATES.bulk_upsert_function.template,
+            self.compiled_iter_all_func,
+            self.compiled_get_many_funcs,
+            self.compiled_by_pk_funcs,
+            self.compiled_cache_funcs,
+            self.compiled_light_funcs,
+            self.compiled_partition_ddl_func,
+            self.compiled_async_funcs,
+            self.compiled_to_dict_func,
+            self.compiled_to_row_func,
+            ALCHEMY_TEMPLATES.from_row_function.template,
+            self.compiled_proxy_cls_func,
+            self.compiled_to_proxy_func,
+            self.compiled_to_proxies_func,
+            ALCHEMY_TEMPLATES.from_proxy_function.template,
+            ALCHEMY_TEMPLATES.from_proxies_function.template,
+            self.compiled_hash_func,
+            self.compiled_eq_func,
+            self.compiled_neq_func,
+            self.compiled_str_func,
+            self.compiled_unicode_func,
+            self.compiled_repr_func,
+        ]
+        return "\n".join(section for section in sections if section)
+
+class PackageCompiler(object):
+    """
+    Class for compiling the package level modules of the generated models, i.e. the __init__
+    from the ModelNodes (see algen.graph) of the whole schema, alchemy_base, alchemy_cache and
+    alchemy_metrics.
+    """
+
+    def __init__(self, nodes=()):
+        self.nodes = sorted(nodes, key=lambda node: node.name)
+        self.username = getuser()
+        self.tab = '    '
+
+    @property
+    @profiled('package')
+    def compiled_package(self):
+        """Returns compiled __init__ with the model registry, the lazy loader and load_all"""
+        plan = load_plan(self.nodes)
+        join_string = "\n" + self.tab
+        models = join_string.join("'{}': '.{}',".format(node.name, node.module_name) for node in self.nodes)
+        tables = join_string.join("'{}': '{}',".format(node.name, node.table_name) for node in self.nodes)
+        related = join_string.join(
+            "'{}': {},".format(node.name, ModelCompiler.compile_name_tuple(plan.relationships[node.name]))
+            for node in self.nodes if plan.relationships[node.name])
+        return ALCHEMY_TEMPLATES.package.safe_substitute(
+            username=self.username,
+            example=self.nodes[0].name if self.nodes else 'Model',
+            models=models,
+            tables=tables,
+            related=related,
+            cycles=", ".join(" <-> ".join(cycle) for cycle in plan.cycles) or 'none',
+            load_order=join_string.join(ModelCompiler.compile_name_tuple(level) + "," for level in plan.levels))
+
+    @property
+    @profiled('base')
+    def compiled_base(self):
+        """Returns compiled alchemy_base with Base and the engine and session factories"""
+        return ALCHEMY_TEMPLATES.base.safe_substitute(username=self.username)
+
+    @property
+    @profiled('cache')
+    def compiled_cache(self):
+        """Returns compiled alchemy_cache with the cache backends and the invalidating session events"""
+        return ALCHEMY_TEMPLATES.cache.safe_substitute(username=self.username)
+
+    @property
+    @profiled('metrics')
+    def compiled_metrics(self):
+        """Returns compiled alchemy_metrics with the metrics sinks and the instrumenting events"""
+        return ALCHEMY_TEMPLATES.metrics.safe_substitute(username=self.username)
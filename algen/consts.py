@@ -2,7 +2,9 @@ from __future__ import print_function, unicode_literals
 
 __author__ = "danishabdullah"
 
-__all__ = ("POSTGRES_TYPES", "MUTABLE_DICT_TYPES", "NO_PARAMS_TYPES")
+__all__ = ("POSTGRES_TYPES", "MUTABLE_DICT_TYPES", "NO_PARAMS_TYPES", "INDEX_METHODS", "LAZY_STRATEGIES",
+           "EAGER_STRATEGIES", "LARGE_COLUMN_TYPES",
+           "PARTITION_STRATEGIES")
 
 POSTGRES_TYPES = ('ARRAY', 'BIGINT', 'BIT', 'BOOLEAN', 'BYTEA', 'CHAR', 'CIDR', 'DATE', 'DOUBLE_PRECISION', 'ENUM',
                   'FLOAT', 'HSTORE', 'INET', 'INTEGER', 'INTERVAL', 'JSON', 'JSONB', 'MACADDR', 'NUMERIC', 'OID',
@@ -10,3 +12,9 @@ POSTGRES_TYPES = ('ARRAY', 'BIGINT', 'BIT', 'BOOLEAN', 'BYTEA', 'CHAR', 'CIDR',
                   'NUMRANGE', 'DATERANGE', 'TSRANGE', 'TSTZRANGE', 'TS')
 MUTABLE_DICT_TYPES = ('HSTORE', 'JSON', 'JSONB')
 NO_PARAMS_TYPES = ('Integer', 'BigInteger', 'Float', 'Decimal', 'Numeric', 'JSONB', 'JSON', 'HSTORE')
+INDEX_METHODS = ('btree', 'hash', 'gin', 'gist', 'spgist', 'brin')
+LAZY_STRATEGIES = ('select', 'selectin', 'joined', 'subquery', 'immediate', 'raise', 'raise_on_sql', 'noload',
+                   'dynamic', 'write_only')
+EAGER_STRATEGIES = ('selectin', 'joined', 'subquery', 'immediate')
+PARTITION_STRATEGIES = ('range', 'list', 'hash')
+LARGE_COLUMN_TYPES = ('JSONB', 'JSON', 'HSTORE', 'Text', 'UnicodeText', 'TEXT', 'BYTEA', 'LargeBinary', 'ARRAY')
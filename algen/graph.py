@@ -0,0 +1,141 @@
+from __future__ import print_function, unicode_literals
+
+import json
+from collections import namedtuple
+
+from algen.ir import convert_case, pluralise
+
+__author__ = "danishabdullah"
+
+__all__ = ('ModelNode', 'LoadPlan', 'model_node', 'dependencies', 'relationships', 'strongly_connected_components',
+           'load_plan', 'topological_order', 'format_load_plan')
+
+ModelNode = namedtuple('ModelNode', ('name', 'module_name', 'table_name', 'references', 'related'))
+LoadPlan = namedtuple('LoadPlan', ('levels', 'cycles', 'dependencies', 'relationships', 'tables'))
+
+
+def model_node(name, model_def):
+    """
+    Returns the ModelNode of a user supplied model i.e. what the schema wide graph needs to know
+    about it: the tables referenced by its foreign keys and the classes of its relationships.
+    """
+    module_name = convert_case(name)
+    references = tuple(sorted(set(column['reference']['table']
+                                  for column in model_def.get('foreign_keys', None) or ())))
+    related = tuple(sorted(set(relationship['class']
+                               for relationship in model_def.get('relationships', None) or ())))
+    return ModelNode(name=name, module_name=module_name, table_name=pluralise(module_name), references=references,
+                     related=related)
+
+
+def dependencies(nodes):
+    """Returns {name: names of the models whose tables the model references}. References to tables
+    outside of nodes and to the model's own table are left out."""
+    tables = dict((node.table_name, node.name) for node in nodes)
+    return dict((node.name, tuple(sorted(set(tables[t] for t in node.references
+                                             if tables.get(t, node.name) != node.name))))
+                for node in nodes)
+
+
+def relationships(nodes):
+    """Returns {name: names of the models the model has relationships with}, within nodes"""
+    names = frozenset(node.name for node in nodes)
+    return dict((node.name, tuple(n for n in node.related if n in names and n != node.name)) for node in nodes)
+
+
+def strongly_connected_components(graph):
+    """
+    Returns the strongly connected components of graph, a mapping of names to the names they
+    point to, using an iterative version of Tarjan's algorithm. Components come out in reverse
+    topological order i.e. after every component they point to.
+    """
+    index, lowlink, on_stack, stack, res = {}, {}, set(), [], []
+    for root in sorted(graph):
+        if root in index:
+            continue
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(graph[root]))]
+        while work:
+            node, targets = work[-1]
+            for target in targets:
+                if target not in index:
+                    index[target] = lowlink[target] = len(index)
+                    stack.append(target)
+                    on_stack.add(target)
+                    work.append((target, iter(graph[target])))
+                    break
+                elif target in on_stack:
+                    lowlink[node] = min(lowlink[node], index[target])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    res.append(tuple(sorted(component)))
+    return res
+
+
+def load_plan(nodes):
+    """
+    Returns the LoadPlan of nodes. levels groups the models so that every model is in a later
+    level than the models whose tables it references; the tables of a level can be loaded in
+    parallel, and truncated in parallel in reverse level order. The models of a foreign key
+    cycle can't be ordered, they share a level and are listed in cycles: load them in one
+    transaction with deferred constraints. Relationships (the soft edges) don't order loading,
+    the two sides of every back_populates pair would form a cycle otherwise.
+    """
+    depends_on = dependencies(nodes)
+    components = strongly_connected_components(depends_on)
+    component_of = dict((name, component) for component in components for name in component)
+    level_of = {}
+    for component in components:
+        targets = set(component_of[t] for name in component for t in depends_on[name]) - set([component])
+        level_of[component] = max([level_of[t] + 1 for t in targets] or [0])
+    levels = [[] for _ in range(max(level_of.values()) + 1)] if level_of else []
+    for component, level in level_of.items():
+        levels[level].extend(component)
+    return LoadPlan(levels=tuple(tuple(sorted(level)) for level in levels),
+                    cycles=tuple(sorted(c for c in components if len(c) > 1)),
+                    dependencies=depends_on,
+                    relationships=relationships(nodes),
+                    tables=dict((node.name, node.table_name) for node in nodes))
+
+
+def topological_order(nodes):
+    """Returns the names of nodes ordered so that every model comes after the models it references,
+    i.e. the flattened levels of their LoadPlan"""
+    return [name for level in load_plan(nodes).levels for name in level]
+
+
+def format_load_plan(plan, fmt='text'):
+    """Returns plan formatted as json or as a human readable report"""
+    if fmt == 'json':
+        return json.dumps(dict(plan._asdict(), levels=[list(n) for n in plan.levels],
+                               cycles=[list(n) for n in plan.cycles]), indent=2, sort_keys=True)
+    lines = []
+    for i, level in enumerate(plan.levels):
+        lines.append("Level {} ({} model(s), load in parallel):".format(i, len(level)))
+        for name in level:
+            depends_on = plan.dependencies[name]
+            lines.append("  {} ({}){}".format(name, plan.tables[name],
+                                               " after " + ", ".join(depends_on) if depends_on else ""))
+    if plan.cycles:
+        lines.append("")
+        lines.append("Foreign key cycles (load each in one transaction with deferred constraints):")
+        lines.extend("  " + " <-> ".join(cycle) for cycle in plan.cycles)
+    soft = sorted((name, related) for name, related in plan.relationships.items() if related)
+    if soft:
+        lines.append("")
+        lines.append("Relationships (don't constrain the order):")
+        lines.extend("  {} -> {}".format(name, ", ".join(related)) for name, related in soft)
+    return "\n".join(lines)
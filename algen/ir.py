@@ -0,0 +1,143 @@
+from __future__ import print_function, unicode_literals
+
+import re
+from collections import namedtuple
+from hashlib import sha1
+
+from algen.consts import POSTGRES_TYPES, MUTABLE_DICT_TYPES
+from algen.profiling import profiled
+
+__author__ = "danishabdullah"
+
+__all__ = ('TYPE_INFO_REGEX', 'ColumnIR', 'ReferenceIR', 'RelationshipIR', 'IndexIR', 'PartitionIR', 'ModelIR',
+           'build_model_ir', 'convert_case', 'pluralise', 'get_col_type_info', 'index_name')
+
+TYPE_INFO_REGEX = re.compile(r"(^\w+)(\(.*\)$)?")
+FIRST_CAP_REGEX = re.compile('(.)([A-Z][a-z]+)')
+ALL_CAP_REGEX = re.compile('([a-z0-9])([A-Z])')
+
+ReferenceIR = namedtuple('ReferenceIR', ('table', 'column'))
+ColumnIR = namedtuple('ColumnIR', ('name', 'type', 'type_params', 'args', 'primary_key', 'reference', 'deferred',
+                                   'group'))
+RelationshipIR = namedtuple('RelationshipIR', ('name', 'class_name', 'lazy', 'args'))
+IndexIR = namedtuple('IndexIR', ('name', 'columns', 'expressions', 'unique', 'where', 'using', 'ops'))
+PartitionIR = namedtuple('PartitionIR', ('strategy', 'column'))
+ModelIR = namedtuple('ModelIR', ('class_name', 'module_name', 'table_name', 'columns', 'foreign_keys',
+                                 'relationships', 'indexes', 'partition', 'load_options', 'types', 'postgres_types',
+                                 'standard_types', 'mutable_dict_types', 'primary_keys', 'column_names',
+                                 'deferred_groups'))
+
+_CASE_CACHE = {}
+
+
+def convert_case(name):
+    """Converts name from CamelCase to snake_case"""
+    try:
+        return _CASE_CACHE[name]
+    except KeyError:
+        s1 = FIRST_CAP_REGEX.sub(r'\1_\2', name)
+        res = _CASE_CACHE[name] = ALL_CAP_REGEX.sub(r'\1_\2', s1).lower()
+        return res
+
+
+def pluralise(name):
+    """Pluralises a snake_case name using utterly simple algo"""
+    last_letter = name[-1]
+    if last_letter in ("y",):
+        return "{}ies".format(name[:-1])
+    elif last_letter in ("s",):
+        return "{}es".format(name)
+    else:
+        return "{}s".format(name)
+
+
+@profiled()
+def get_col_type_info(string):
+    """Splits a type string like Unicode(255) into its name and params i.e. ('Unicode', '(255)')"""
+    match = TYPE_INFO_REGEX.match(string)
+    if match is None:
+        return '', ''
+    name, params = match.groups()
+    return name if name else '', params if params else ''
+
+
+def _build_column(column, excluded_args, reference=None):
+    column_type, type_params = get_col_type_info(column.get('type'))
+    args = tuple((arg_name, arg_val) for arg_name, arg_val in column.items()
+                 if arg_name not in excluded_args and arg_name not in ('deferred', 'group'))
+    group = column.get('group', None)
+    return ColumnIR(name=column['name'], type=column_type, type_params=type_params, args=args,
+                    primary_key=bool(column.get('primary_key', False)), reference=reference,
+                    deferred=bool(column.get('deferred', False) or group), group=group)
+
+
+def index_name(index, table_name):
+    """Returns the name of a user supplied index, ix_<table>_<columns> unless named. Expressions are
+    named by a short hash of their text so that the expression indexes of a table don't collide"""
+    if index.get('name', None):
+        return index['name']
+    parts = list(index.get('columns', None) or ())
+    expressions = index.get('expressions', None) or ()
+    if expressions:
+        parts.append(sha1("\n".join(expressions).encode('utf-8')).hexdigest()[:8])
+    return "ix_{}_{}".format(table_name, "_".join(parts))
+
+
+def _build_index(index, table_name):
+    columns = tuple(index.get('columns', None) or ())
+    expressions = tuple(index.get('expressions', None) or ())
+    name = index_name(index, table_name)
+    return IndexIR(name=name, columns=columns, expressions=expressions, unique=bool(index.get('unique', False)),
+                   where=index.get('where', None), using=index.get('using', None),
+                   ops=tuple(sorted((index.get('ops', None) or {}).items())))
+
+
+def _build_partition(partition_by):
+    if not partition_by:
+        return None
+    return PartitionIR(strategy=partition_by['strategy'].lower(), column=partition_by['column'])
+
+
+def build_model_ir(class_name, model_def):
+    """
+    Builds the immutable intermediate representation of a user supplied model in a single pass
+    over its definition. Every emitter in ModelCompiler renders from the result.
+    """
+    if not class_name:
+        raise ValueError
+    columns = tuple(_build_column(column, ('name', 'type')) for column in model_def['columns'])
+    foreign_keys = tuple(
+        _build_column(column, ('name', 'type', 'reference'),
+                      reference=ReferenceIR(column['reference']['table'], column['reference']['column']))
+        for column in model_def.get('foreign_keys', None) or ())
+    relationships = tuple(
+        RelationshipIR(name=relationship['name'], class_name=relationship['class'],
+                       lazy=relationship.get('lazy', 'select'),
+                       args=tuple((arg_name, arg_val) for arg_name, arg_val in relationship.items()
+                                  if arg_name not in ('name', 'type', 'reference', 'class')))
+        for relationship in model_def.get('relationships', None) or ())
+
+    types, seen = [], set()
+    for column in columns + foreign_keys:
+        if column.type and column.type not in seen:
+            seen.add(column.type)
+            types.append(column.type)
+    module_name = convert_case(class_name)
+    table_name = pluralise(module_name)
+    return ModelIR(class_name=class_name,
+                   module_name=module_name,
+                   table_name=table_name,
+                   columns=columns,
+                   foreign_keys=foreign_keys,
+                   relationships=relationships,
+                   indexes=tuple(_build_index(index, table_name) for index in model_def.get('indexes', None) or ()),
+                   partition=_build_partition(model_def.get('partition_by', None)),
+                   load_options=tuple((name, tuple(paths))
+                                      for name, paths in (model_def.get('load_options', None) or {}).items()),
+                   types=tuple(types),
+                   postgres_types=tuple(n for n in types if n in POSTGRES_TYPES),
+                   standard_types=tuple(n for n in types if n not in POSTGRES_TYPES),
+                   mutable_dict_types=tuple(n for n in types if n in MUTABLE_DICT_TYPES),
+                   primary_keys=tuple(c.name for c in columns + foreign_keys if c.primary_key),
+                   column_names=tuple(c.name for c in columns + foreign_keys),
+                   deferred_groups=tuple(sorted(set(c.group for c in columns + foreign_keys if c.group))))
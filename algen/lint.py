@@ -0,0 +1,130 @@
+from __future__ import print_function, unicode_literals
+
+import json
+from collections import namedtuple
+
+from algen.consts import LARGE_COLUMN_TYPES
+from algen.ir import build_model_ir
+
+__author__ = "danishabdullah"
+
+__all__ = ('SEVERITIES', 'LintIssue', 'lint_model', 'lint_model_def', 'lint_model_defs', 'format_issues')
+
+SEVERITIES = ('info', 'warning', 'error')
+GIN_INDEXABLE_TYPES = ('JSONB', 'HSTORE')
+UNBOUNDED_TEXT_TYPES = ('Text', 'UnicodeText', 'TEXT')
+SIZED_TEXT_TYPES = ('String', 'Unicode', 'VARCHAR', 'CHAR')
+EAGER_LAZY_STRATEGIES = ('selectin', 'joined', 'subquery', 'immediate', 'raise', 'raise_on_sql', 'noload',
+                         'dynamic', 'write_only')
+
+LintIssue = namedtuple('LintIssue', ('code', 'severity', 'model', 'subject', 'message'))
+# what building the ModelIR of a malformed definition raises, e.g. a column type that isn't a string
+BUILD_ERRORS = (AttributeError, KeyError, TypeError, ValueError)
+
+
+def _is_unbounded_text(column):
+    if column.type in UNBOUNDED_TEXT_TYPES:
+        return True
+    return column.type in SIZED_TEXT_TYPES and column.type_params in ('', '()')
+
+
+def _leading_index_columns(ir):
+    """Names of the columns which lead an index, i.e. can be looked up without a sequential scan"""
+    res = set(c.name for c in ir.columns + ir.foreign_keys if dict(c.args).get('index', False))
+    res.update(index.columns[0] for index in ir.indexes if index.columns)
+    if ir.primary_keys:
+        res.add(ir.primary_keys[0])
+    return res
+
+
+def _unique_key_columns(ir):
+    res = set(ir.primary_keys)
+    res.update(c.name for c in ir.columns + ir.foreign_keys if dict(c.args).get('unique', False))
+    for index in ir.indexes:
+        if index.unique:
+            res.update(index.columns)
+    return res
+
+
+def lint_model(ir, async_mode=False):
+    """Returns the LintIssues found in the ModelIR ir. async_mode is the option the model is compiled
+    with, under which the relationships not declaring a lazy strategy are loaded with selectin"""
+    res = []
+    name = ir.class_name
+
+    if not ir.primary_keys:
+        res.append(LintIssue('AL004', 'error', name, ir.table_name,
+                             "Model has no primary key. The generated __hash__/__eq__ and every "
+                             "primary key based helper are broken or missing"))
+
+    indexed = _leading_index_columns(ir)
+    for column in ir.foreign_keys:
+        if column.name not in indexed:
+            res.append(LintIssue('AL001', 'warning', name, column.name,
+                                 "Foreign key to {}.{} has no index. Joins and ON DELETE checks on "
+                                 "{} scan the whole table".format(column.reference.table, column.reference.column,
+                                                                  ir.table_name)))
+
+    gin_indexed = set(index.columns[0] for index in ir.indexes if index.using == 'gin' and index.columns)
+    for column in ir.columns + ir.foreign_keys:
+        if column.type in GIN_INDEXABLE_TYPES and column.name not in gin_indexed:
+            res.append(LintIssue('AL002', 'warning', name, column.name,
+                                 "{} column has no GIN index. Containment and key existence "
+                                 "queries scan the whole table".format(column.type)))
+
+    unique_keys = _unique_key_columns(ir)
+    for column in ir.columns + ir.foreign_keys:
+        if column.name in unique_keys and _is_unbounded_text(column):
+            res.append(LintIssue('AL003', 'warning', name, column.name,
+                                 "Unbounded {}{} column is part of a primary or unique key. Give it a "
+                                 "length to keep the index entries small".format(column.type, column.type_params)))
+
+    for column in ir.columns + ir.foreign_keys:
+        if column.type in LARGE_COLUMN_TYPES and not column.deferred and not column.primary_key:
+            res.append(LintIssue('AL006', 'info', name, column.name,
+                                 "Large {} column is loaded with every row. Mark it deferred or put it in "
+                                 "a group unless most queries read it".format(column.type)))
+
+    if ir.partition:
+        unique_keys = [('primary key', ir.primary_keys)] if ir.primary_keys else []
+        unique_keys.extend((index.name, index.columns) for index in ir.indexes if index.unique)
+        unique_keys.extend((c.name, (c.name,)) for c in ir.columns + ir.foreign_keys
+                           if dict(c.args).get('unique', False))
+        for key_name, columns in unique_keys:
+            if ir.partition.column not in columns:
+                res.append(LintIssue('AL007', 'error', name, key_name,
+                                     "Unique key doesn't include the partition column {}. Postgres can't "
+                                     "enforce it on a partitioned table".format(ir.partition.column)))
+
+    for relationship in ir.relationships:
+        if async_mode and 'lazy' not in dict(relationship.args):
+            continue
+        if relationship.lazy not in EAGER_LAZY_STRATEGIES:
+            res.append(LintIssue('AL005', 'info', name, relationship.name,
+                                 "Relationship to {} uses lazy loading, accessing it for every row of "
+                                 "a result issues N+1 queries".format(relationship.class_name)))
+    return res
+
+
+def lint_model_def(name, model_def, async_mode=False):
+    """Returns the LintIssues of a user supplied model, an AL000 error when its definition can't be built"""
+    try:
+        ir = build_model_ir(name, model_def)
+    except BUILD_ERRORS as e:
+        return [LintIssue('AL000', 'error', name, name,
+                          "Model definition can't be compiled ({}: {})".format(type(e).__name__, e))]
+    return lint_model(ir, async_mode=async_mode)
+
+
+def lint_model_defs(items, async_mode=False):
+    """Yields the LintIssues of an iterable of (name, model_def) pairs"""
+    for name, model_def in items:
+        for issue in lint_model_def(name, model_def, async_mode=async_mode):
+            yield issue
+
+
+def format_issues(issues, fmt='text'):
+    """Returns issues formatted as json (a list of objects) or as one line of text per issue"""
+    if fmt == 'json':
+        return json.dumps([issue._asdict() for issue in issues], indent=2)
+    return "\n".join("{i.model}.{i.subject}: {i.severity} {i.code} {i.message}".format(i=issue) for issue in issues)
@@ -0,0 +1,101 @@
+from __future__ import print_function, unicode_literals
+
+import hashlib
+import json
+from os import path, remove
+
+try:
+    from os import replace
+except ImportError:  # python 2
+    from os import rename as replace
+
+from algen import __version__
+from algen.templates import ALCHEMY_TEMPLATES
+
+__author__ = "danishabdullah"
+
+__all__ = ('MANIFEST_NAME', 'Manifest', 'template_fingerprint', 'model_digest')
+
+MANIFEST_NAME = '.algen-manifest.json'
+MANIFEST_FORMAT = 1
+
+_FINGERPRINT = []
+
+
+def template_fingerprint():
+    """Returns a digest of the algen version and every template, computed once per process"""
+    if not _FINGERPRINT:
+        digest = hashlib.sha1(__version__.encode('utf-8'))
+        for key, template in sorted(vars(ALCHEMY_TEMPLATES).items()):
+            digest.update(key.encode('utf-8'))
+            digest.update(getattr(template, 'template', '').encode('utf-8'))
+        _FINGERPRINT.append(digest.hexdigest())
+    return _FINGERPRINT[0]
+
+
+def model_digest(name, model_def, options=None):
+    """Returns a digest of a model's normalized definition, the compile options and the templates"""
+    normalized = json.dumps([name, model_def, options or {}], sort_keys=True, separators=(',', ':'), default=str)
+    digest = hashlib.sha1(template_fingerprint().encode('utf-8'))
+    digest.update(normalized.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class Manifest(object):
+    """
+    Records, for every generated model, the file it was written to and the digest of
+    the definition it was generated from. Stored as json in the destination directory.
+    """
+
+    def __init__(self, destination):
+        self.destination = destination
+        self.filename = path.join(destination, MANIFEST_NAME)
+        self.entries = {}
+        self.changed = False
+        if path.exists(self.filename):
+            try:
+                with open(self.filename, 'r') as fyle:
+                    data = json.load(fyle)
+            except ValueError:
+                data = {}
+            if data.get('format') == MANIFEST_FORMAT:
+                self.entries = data.get('models', {})
+
+    def is_fresh(self, name, digest):
+        """True when name was generated from digest and its file is still present"""
+        entry = self.entries.get(name)
+        return bool(entry and entry['digest'] == digest and path.exists(path.join(self.destination, entry['file'])))
+
+    def update(self, name, digest, filename):
+        entry = {'digest': digest, 'file': path.basename(filename)}
+        if self.entries.get(name) != entry:
+            self.entries[name] = entry
+            self.changed = True
+
+    def discard(self, name):
+        if self.entries.pop(name, None) is not None:
+            self.changed = True
+
+    def removed(self, names):
+        """Returns {name: filename} for the recorded models which are not in names"""
+        return {n: path.join(self.destination, e['file']) for n, e in self.entries.items() if n not in names}
+
+    def prune(self, names):
+        """Deletes the files of the recorded models which are not in names. Returns the deleted files"""
+        res = []
+        for name, filename in sorted(self.removed(names).items()):
+            if path.exists(filename):
+                remove(filename)
+                res.append(filename)
+            self.discard(name)
+        return res
+
+    def save(self):
+        """Writes the manifest atomically, and only if something changed"""
+        if not self.changed:
+            return
+        tmp = "{}.tmp".format(self.filename)
+        with open(tmp, 'w') as fyle:
+            json.dump({'format': MANIFEST_FORMAT, 'models': self.entries}, fyle, indent=2, sort_keys=True)
+        replace(tmp, self.filename)
+        self.changed = False
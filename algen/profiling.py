@@ -0,0 +1,207 @@
+from __future__ import print_function, unicode_literals
+
+import threading
+from functools import wraps
+from string import Template
+from timeit import default_timer
+
+__author__ = "danishabdullah"
+
+__all__ = ('add_hook', 'remove_hook', 'Phase', 'profiled', 'ProfiledTemplate', 'Profiler')
+
+_HOOKS = []
+_LOCAL = threading.local()
+
+
+def add_hook(hook):
+    """
+    Registers hook to be called as hook(model, frames, seconds, self_seconds) every time a
+    profiled phase finishes. frames is the tuple of the nested phase names ending with the
+    finished one, self_seconds excludes the time spent in nested phases. While no hook is
+    registered phases cost a single list lookup.
+    """
+    _HOOKS.append(hook)
+
+
+def remove_hook(hook):
+    _HOOKS.remove(hook)
+
+
+def _stack():
+    try:
+        return _LOCAL.stack
+    except AttributeError:
+        _LOCAL.stack = []
+        return _LOCAL.stack
+
+
+class Phase(object):
+    """
+    Context manager timing a named phase of the compilation of model. Nested phases without
+    a model inherit it from the enclosing phase.
+    """
+    __slots__ = ('stage', 'model', 'start', 'children')
+
+    def __init__(self, stage, model=None):
+        self.stage = stage
+        self.model = model
+        self.start = None
+        self.children = 0.0
+
+    def __enter__(self):
+        if _HOOKS:
+            stack = _stack()
+            if self.model is None and stack:
+                self.model = stack[-1].model
+            stack.append(self)
+            self.start = default_timer()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.start is None:
+            return False
+        seconds = default_timer() - self.start
+        stack = _stack()
+        stack.pop()
+        if stack:
+            stack[-1].children += seconds
+        frames = tuple(p.stage for p in stack) + (self.stage,)
+        for hook in list(_HOOKS):
+            hook(self.model, frames, seconds, seconds - self.children)
+        return False
+
+
+def profiled(stage=None, model_attr=None):
+    """
+    Decorator running the decorated function inside a Phase named stage, the function name by
+    default. When model_attr is given the model is read from that attribute of the first argument.
+    """
+
+    def decorator(func):
+        name = stage or func.__name__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _HOOKS:
+                return func(*args, **kwargs)
+            model = getattr(args[0], model_attr, None) if model_attr else None
+            with Phase(name, model):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class ProfiledTemplate(Template):
+    """string.Template whose substitutions are reported as a 'template:<name>' phase"""
+
+    def __init__(self, template, name):
+        super(ProfiledTemplate, self).__init__(template)
+        self.stage = "template:{}".format(name)
+
+    def safe_substitute(self, *args, **kwargs):
+        if not _HOOKS:
+            return super(ProfiledTemplate, self).safe_substitute(*args, **kwargs)
+        with Phase(self.stage):
+            return super(ProfiledTemplate, self).safe_substitute(*args, **kwargs)
+
+
+class Profiler(object):
+    """
+    Hook aggregating wall time and call counts of every phase, per model and in total. Use it
+    as a context manager to register it for the duration of a block:
+
+        with Profiler() as profiler:
+            ModelCompiler(name, model_def).compiled_model
+        print(profiler.report())
+    """
+
+    def __init__(self):
+        # {(model, frames): [calls, seconds, self_seconds]}
+        self.records = {}
+
+    def __call__(self, model, frames, seconds, self_seconds):
+        key = (model, frames)
+        record = self.records.get(key)
+        if record is None:
+            self.records[key] = [1, seconds, self_seconds]
+        else:
+            record[0] += 1
+            record[1] += seconds
+            record[2] += self_seconds
+
+    def __enter__(self):
+        add_hook(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        remove_hook(self)
+        return False
+
+    def merge(self, records):
+        """Adds the records of another Profiler, e.g. one that ran in a worker process"""
+        for key, (calls, seconds, self_seconds) in records.items():
+            record = self.records.setdefault(key, [0, 0.0, 0.0])
+            record[0] += calls
+            record[1] += seconds
+            record[2] += self_seconds
+
+    def stages(self):
+        """Returns {stage: [calls, seconds]} over all models"""
+        res = {}
+        for (model, frames), (calls, seconds, _) in self.records.items():
+            if frames[-1] in frames[:-1]:
+                # time of recursive phases is already accounted for by the outer phase
+                seconds = 0.0
+            record = res.setdefault(frames[-1], [0, 0.0])
+            record[0] += calls
+            record[1] += seconds
+        return res
+
+    def models(self):
+        """Returns {model: seconds} i.e. the total time attributed to every model"""
+        res = {}
+        for (model, frames), (_, _, self_seconds) in self.records.items():
+            res[model] = res.get(model, 0.0) + self_seconds
+        return res
+
+    def model_stages(self, model):
+        """Returns {stage: [calls, seconds]} for model"""
+        res = {}
+        for (name, frames), (calls, seconds, _) in self.records.items():
+            if name != model:
+                continue
+            record = res.setdefault(frames[-1], [0, 0.0])
+            record[0] += calls
+            record[1] += seconds
+        return res
+
+    def report(self, top=10):
+        """Returns a human readable summary of the stages and of the top slowest models"""
+        lines = ["{:<40} {:>10} {:>12}".format('stage', 'calls', 'seconds')]
+        for stage, (calls, seconds) in sorted(self.stages().items(), key=lambda x: -x[1][1]):
+            lines.append("{:<40} {:>10} {:>12.6f}".format(stage, calls, seconds))
+        models = sorted(self.models().items(), key=lambda x: -x[1])[:top]
+        if models:
+            lines.append("")
+            lines.append("{:<40} {:>23}".format('slowest models', 'seconds'))
+            for model, seconds in models:
+                stages = sorted(self.model_stages(model).items(), key=lambda x: -x[1][1])[:3]
+                lines.append("{:<40} {:>23.6f}".format(model, seconds))
+                for stage, (calls, stage_seconds) in stages:
+                    lines.append("  {:<38} {:>10} {:>12.6f}".format(stage, calls, stage_seconds))
+        return "\n".join(lines)
+
+    def collapsed(self):
+        """Yields the records in the collapsed stack format understood by flamegraph.pl and
+        speedscope, i.e. 'model;phase;nested_phase microseconds' using self time."""
+        records = sorted(self.records.items(), key=lambda x: (str(x[0][0]), x[0][1]))
+        for (model, frames), (_, _, self_seconds) in records:
+            stack = ";".join((str(model),) + frames)
+            yield "{} {}".format(stack, max(int(round(self_seconds * 1e6)), 0))
+
+    def dump_collapsed(self, fyle):
+        for line in self.collapsed():
+            fyle.write(line)
+            fyle.write("\n")
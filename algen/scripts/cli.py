@@ -1,15 +1,33 @@
 from __future__ import print_function, unicode_literals
 
-from os import getcwd, path, makedirs
+import re
+from functools import partial
+from glob import glob
+from multiprocessing import Pool, cpu_count
+from os import getcwd, path, makedirs, walk
 
-import yaml
+import yaml as yaml_module
 import click
 
-from algen.compilers import ModelCompiler
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
+
+from algen.compilers import MODES, ModelCompiler, PackageCompiler
+from algen.consts import INDEX_METHODS, LAZY_STRATEGIES, PARTITION_STRATEGIES
+from algen.graph import model_node, load_plan, format_load_plan
+from algen.ir import convert_case, index_name, pluralise
+from algen.lint import SEVERITIES, lint_model_def, lint_model_defs, format_issues
+from algen.manifest import Manifest, model_digest
+from algen.profiling import Phase, Profiler
 
 __author__ = "danishabdullah"
 
 
+IDENTIFIER_REGEX = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
 class DirectoryCreationException(Exception):
     pass
 
@@ -60,6 +78,18 @@ def ensure_types(model_defs):
                 raise InvalidModelDefinition("Missing 'type")
 
 
+def ensure_deferred(model_defs):
+    for model_def in model_defs.values():
+        for column in model_def['columns'] + model_def.get('foreign_keys', []):
+            if not (column.get('deferred', False) or column.get('group', None)):
+                continue
+            if column.get('primary_key', False):
+                raise InvalidModelDefinition("Primary key {} can't be deferred".format(column['name']))
+            group = column.get('group', None)
+            if group is not None and not IDENTIFIER_REGEX.match(str(group)):
+                raise InvalidModelDefinition("Invalid column group {}".format(group))
+
+
 def ensure_foreign_keys(model_defs):
     for model_def in model_defs.values():
         for column in model_def.get('foreign_keys', []):
@@ -84,20 +114,139 @@ def ensure_relationships(model_defs):
                 raise InvalidModelDefinition("Missing 'name")
             if not column.get('class', None):
                 raise InvalidModelDefinition("Missing 'class' from relationship")
+            if column.get('lazy', 'select') not in LAZY_STRATEGIES:
+                raise InvalidModelDefinition("Relationship 'lazy' must be one of {}".format(", ".join(LAZY_STRATEGIES)))
 
 
-def parse_yaml(pth):
-    if not path.exists(pth):
-        raise FileNotFound
-
-    with open(pth, 'r') as fyle:
-        model_defs = yaml.load(fyle)
-    assert isinstance(model_defs, dict)
+def ensure_load_options(model_defs):
+    for model_def in model_defs.values():
+        load_options = model_def.get('load_options', {})
+        if not isinstance(load_options, dict):
+            raise InvalidModelDefinition("'load_options' must map names to lists of relationship paths")
+        relationships = set(n['name'] for n in model_def.get('relationships', []))
+        for name, paths in load_options.items():
+            if not IDENTIFIER_REGEX.match(name) or name in ('path', 'with_all') or (
+                    name.startswith('with_') and name[5:] in relationships):
+                raise InvalidModelDefinition("Invalid or reserved load_options name {}".format(name))
+            if not isinstance(paths, list) or not paths:
+                raise InvalidModelDefinition("load_options {} must be a list of relationship paths".format(name))
+            for pth in paths:
+                if pth.split('.')[0] not in relationships:
+                    raise InvalidModelDefinition("load_options {} refers to unknown relationship {}".format(name, pth))
+
+
+def ensure_indexes(model_defs):
+    for name, model_def in model_defs.items():
+        columns = set(n['name'] for n in model_def['columns'])
+        columns.update(n['name'] for n in model_def.get('foreign_keys', []))
+        table_name = pluralise(convert_case(name))
+        names = set()
+        for index in model_def.get('indexes', []):
+            if not isinstance(index, dict):
+                raise InvalidModelDefinition("Index definitions must be mappings")
+            if not (index.get('columns', None) or index.get('expressions', None)):
+                raise InvalidModelDefinition("Missing 'columns' or 'expressions' from index")
+            unknown = set(index.get('columns', None) or []) - columns
+            if unknown:
+                raise InvalidModelDefinition("Unknown index column(s) {}".format(", ".join(sorted(unknown))))
+            if index.get('using', None) not in (None,) + INDEX_METHODS:
+                raise InvalidModelDefinition("Index 'using' must be one of {}".format(", ".join(INDEX_METHODS)))
+            if set(index.get('ops', None) or {}) - set(index.get('columns', None) or []):
+                raise InvalidModelDefinition("Index 'ops' must be keyed by the index columns")
+            ix_name = index_name(index, table_name)
+            if ix_name in names:
+                raise InvalidModelDefinition("Duplicate index name {}, name the indexes explicitly".format(ix_name))
+            names.add(ix_name)
+
+
+def ensure_partition(model_defs):
+    for model_def in model_defs.values():
+        partition_by = model_def.get('partition_by', None)
+        if partition_by is None:
+            continue
+        if not isinstance(partition_by, dict):
+            raise InvalidModelDefinition("'partition_by' must be a mapping with a 'strategy' and a 'column'")
+        if str(partition_by.get('strategy', '')).lower() not in PARTITION_STRATEGIES:
+            raise InvalidModelDefinition(
+                "Partition 'strategy' must be one of {}".format(", ".join(PARTITION_STRATEGIES)))
+        columns = set(n['name'] for n in model_def['columns'])
+        columns.update(n['name'] for n in model_def.get('foreign_keys', []))
+        if partition_by.get('column', None) not in columns:
+            raise InvalidModelDefinition("Unknown partition column {}".format(partition_by.get('column', None)))
+
+
+def ensure_model_def(name, model_def):
+    if not isinstance(model_def, dict) or not isinstance(model_def.get('columns', None), list):
+        raise InvalidModelDefinition("{} must be a mapping with a list of 'columns'".format(name))
+    model_defs = {name: model_def}
     ensure_names(model_defs)
     ensure_types(model_defs)
     ensure_foreign_keys(model_defs)
+    ensure_deferred(model_defs)
     ensure_relationships(model_defs)
-    return model_defs
+    ensure_load_options(model_defs)
+    ensure_indexes(model_defs)
+    ensure_partition(model_defs)
+
+
+def find_yaml_files(pth):
+    """Expands pth, which may be a file, a directory or a glob, to a sorted list of yaml files"""
+    if path.isdir(pth):
+        files = [path.join(root, f) for root, _, fyles in walk(pth) for f in fyles if f.endswith(('.yml', '.yaml'))]
+    else:
+        files = [f for f in glob(pth) if path.isfile(f)]
+    if not files:
+        raise FileNotFound
+    return sorted(files)
+
+
+def iter_yaml(pth, errors=None):
+    """Yields validated (name, model_def) pairs from every yaml document found under pth as soon
+    as each document is parsed, so that compilation can start before the whole schema is read.
+    When errors is a list, the invalid models, documents and files are appended to it as (name,
+    message) pairs and skipped instead of raising, so that the rest of the schema still comes out."""
+
+    def invalid(name, message):
+        if errors is None:
+            raise InvalidModelDefinition(message)
+        errors.append((name, message))
+
+    seen = set()
+    for filename in find_yaml_files(pth):
+        with open(filename, 'r') as fyle:
+            documents = yaml_module.load_all(fyle, Loader=YamlLoader)
+            while True:
+                try:
+                    document = next(documents)
+                except StopIteration:
+                    break
+                except yaml_module.YAMLError as e:
+                    if errors is None:
+                        raise
+                    errors.append((filename, "Invalid yaml: {}".format(e)))
+                    break
+                if document is None:
+                    continue
+                if not isinstance(document, dict):
+                    invalid(filename, "{} must contain a mapping of models".format(filename))
+                    continue
+                for name, model_def in document.items():
+                    if name in seen:
+                        invalid(name, "{} is defined more than once".format(name))
+                        continue
+                    seen.add(name)
+                    try:
+                        ensure_model_def(name, model_def)
+                    except InvalidModelDefinition as e:
+                        if errors is None:
+                            raise
+                        errors.append((name, str(e)))
+                        continue
+                    yield name, model_def
+
+
+def parse_yaml(pth):
+    return dict(iter_yaml(pth))
 
 
 def get_model_defs(name=None, columns=None, yaml=None):
@@ -108,6 +257,114 @@ def get_model_defs(name=None, columns=None, yaml=None):
     return model_defs
 
 
+def iter_model_defs(name=None, columns=None, yaml=None, errors=None):
+    if yaml:
+        return iter_yaml(yaml, errors)
+    return iter(parse_cli_columns(name, columns).items())
+
+
+def compile_model(item, options=None):
+    """Compiles a single (name, model_def) pair, options are ModelCompiler keyword arguments.
+    Returns (name, model, error) so that a failing model can be reported without stopping the rest."""
+    name, model_def = item
+    try:
+        with Phase('compile', name):
+            return name, ModelCompiler(name, model_def, **(options or {})).compiled_model, None
+    except Exception as e:
+        return name, None, "{}: {}".format(type(e).__name__, e)
+
+
+def compile_model_profiled(item, options=None):
+    """compile_model for worker processes, also returns the records of the profiled phases"""
+    with Profiler() as profiler:
+        res = compile_model(item, options)
+    return res + (profiler.records,)
+
+
+def compile_models(items, jobs=1, chunksize=8, profiler=None, options=None):
+    """Yields compile_model results for an iterable of (name, model_def) pairs, in order.
+    With jobs > 1 the work is fanned out to a process pool, results still come back in the
+    original order so the output is identical to a serial run. The phases profiled in the
+    worker processes are merged into profiler."""
+    if jobs <= 1:
+        for item in items:
+            yield compile_model(item, options)
+        return
+    pool = Pool(jobs)
+    try:
+        if profiler is None:
+            for res in pool.imap(partial(compile_model, options=options), items, chunksize):
+                yield res
+        else:
+            for name, model, error, records in pool.imap(partial(compile_model_profiled, options=options), items,
+                                                         chunksize):
+                profiler.merge(records)
+                yield name, model, error
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def select_stale(items, manifest, digests, names, nodes=None, options=None):
+    """Yields the (name, model_def) pairs that aren't fresh in the manifest given the compile
+    options. Records the digest of every model in digests, every name seen in names and, when
+    given, its ModelNode in nodes."""
+    for name, model_def in items:
+        names.add(name)
+        if nodes is not None:
+            nodes.append(model_node(name, model_def))
+        if manifest is None:
+            yield name, model_def
+            continue
+        digest = digests[name] = model_digest(name, model_def, options)
+        if manifest.is_fresh(name, digest):
+            continue
+        yield name, model_def
+
+
+def collect_lint_issues(items, issues, async_mode=False):
+    """Passes the (name, model_def) pairs of items through, collecting their lint issues into issues"""
+    for name, model_def in items:
+        issues.extend(lint_model_def(name, model_def, async_mode=async_mode))
+        yield name, model_def
+
+
+def write_model(destination, name, model, only_if_changed=False):
+    """Writes model to its file in destination. Returns the filename or None when it failed"""
+    filename = "{}/{}.py".format(destination, ModelCompiler.convert_case(name))
+    if only_if_changed and path.exists(filename):
+        with open(filename, 'r') as fyle:
+            if fyle.read() == model:
+                click.echo("Unchanged {} in {}".format(name, filename))
+                return filename
+    try:
+        # file is not writeable
+        with Phase('write_file', name), open(filename, 'w') as fyle:
+            click.echo("Writing {} to {}".format(name, filename))
+            fyle.write(model)
+    except IOError:
+        click.echo("The following python model was generated:\n\n{}"
+                   "Cannot write model  to {}. Make sure the "
+                   "destination is writable.\n"
+                   .format(name, filename))
+        return None
+    return filename
+
+
+def write_module(destination, module_name, source, description):
+    """Writes a package level module to destination, unless it is unchanged"""
+    filename = path.join(destination, '{}.py'.format(module_name))
+    if path.exists(filename):
+        with open(filename, 'r') as fyle:
+            if fyle.read() == source:
+                return filename
+    with Phase('write_file', module_name), open(filename, 'w') as fyle:
+        click.echo("Writing {} to {}".format(description, filename))
+        fyle.write(source)
+    return filename
+
+
 @click.command()
 @click.option('--name', '-n', help='Name of model', type=str)
 @click.option('--columns', '-c',
@@ -119,14 +376,70 @@ def get_model_defs(name=None, columns=None, yaml=None):
                                            "assume 'models' directory inside the"
                                            " current working directory"),
               type=click.Path(exists=True))
-@click.option('--yaml', '-y', help=("Yaml file describing the Model. This "
-                                    "supersedes the column definition provided "
-                                    "through --columns option."),
-              type=click.Path(exists=True))
-def cli(name, columns, destination, yaml):
+@click.option('--yaml', '-y', help=("Yaml file describing the Model. A directory "
+                                    "or a quoted glob of yaml files may be used "
+                                    "as well. This supersedes the column "
+                                    "definition provided through --columns option."),
+              type=str)
+@click.option('--jobs', '-j', help=("Number of processes used to compile the models. "
+                                    "0 uses one per cpu core."),
+              type=click.IntRange(min=0), default=1, show_default=True)
+@click.option('--incremental', '-i', is_flag=True,
+              help=("Only regenerate models whose definition changed since the last "
+                    "incremental run. Keeps a manifest in the destination directory."))
+@click.option('--prune', is_flag=True,
+              help=("With --incremental, delete the files of models which are no longer "
+                    "defined instead of only reporting them."))
+@click.option('--profile', is_flag=True,
+              help=("Report wall time and call counts of every compilation phase, "
+                    "template substitution and file write, per model and in total."))
+@click.option('--profile-output', type=click.Path(),
+              help=("With --profile, also dump the phases to this file in the collapsed "
+                    "stack format understood by flamegraph.pl and speedscope."))
+@click.option('--mode', type=click.Choice(MODES), default='orm', show_default=True,
+              help=("Generate declarative orm classes, core Tables with slotted row records "
+                    "instead, or both."))
+@click.option('--async', 'async_mode', is_flag=True,
+              help=("Also generate AsyncSession coroutines (async_add, async_get, "
+                    "async_get_many...) and load relationships with selectin by default."))
+@click.option('--cache', is_flag=True,
+              help=("Generate get_cached, a read-through cache of get by primary key holding "
+                    "proxies, invalidated on add/update/delete and commit. Also writes the "
+                    "alchemy_cache module with the pluggable backends."))
+@click.option('--instrument', is_flag=True,
+              help=("Register every model with event listeners feeding its statement latency, "
+                    "loaded rows, lazy loads and flush sizes to a metrics sink. Also writes the "
+                    "alchemy_metrics module with the sinks, an in memory registry by default."))
+@click.option('--base', is_flag=True,
+              help=("Also generate the alchemy_base module providing Base, an engine factory "
+                    "with tuned pooling and session factories with read replica routing."))
+@click.option('--package', is_flag=True,
+              help=("Also generate the __init__ of the models package, a registry importing "
+                    "every model lazily on first access, with a load_all() in dependency order."))
+@click.option('--load-plan', 'show_load_plan', is_flag=True,
+              help=("Only print the foreign key dependency levels of the models, the tables "
+                    "of a level can be bulk loaded or truncated in parallel, and the cycles."))
+@click.option('--load-plan-format', type=click.Choice(['text', 'json']), default='text', show_default=True)
+@click.option('--lint/--no-lint', default=True, show_default=True,
+              help="Report performance antipatterns of the models being generated.")
+@click.option('--lint-only', is_flag=True,
+              help=("Only lint the model definitions, print the issues and exit with 1 "
+                    "when any is at least as severe as --lint-fail-on."))
+@click.option('--lint-format', type=click.Choice(['text', 'json']), default='text', show_default=True)
+@click.option('--lint-fail-on', type=click.Choice(SEVERITIES), default='warning', show_default=True)
+def cli(name, columns, destination, yaml, jobs, incremental, prune, profile, profile_output, mode,
+        async_mode, cache, instrument, base, package, show_load_plan, load_plan_format, lint, lint_only, lint_format,
+        lint_fail_on):
+    if show_load_plan:
+        return report_load_plan(name, columns, yaml, load_plan_format)
+    if lint_only:
+        return lint_models(name, columns, yaml, lint_format, lint_fail_on, async_mode=async_mode)
+    if mode == 'core' and (async_mode or cache or package):
+        raise click.ClickException("--async, --cache and --package need the orm classes, use --mode orm or both")
     click.echo('Creating Models with the following options:\n'
                '  --name:{}\n  --columns:{}\n  --destination:{}\n'
-               '  --yaml:{}'.format(name, columns, destination, yaml))
+               '  --yaml:{}\n  --jobs:{}\n  --incremental:{}'.format(name, columns, destination, yaml, jobs,
+                                                              incremental))
     if destination:
         if destination.endswith('/'):
             destination = destination[:len(destination) - 1]
@@ -142,39 +455,161 @@ def cli(name, columns, destination, yaml):
     if not (columns or yaml):
         click.echo("You must provide at least one of --columns or --yaml")
         return
+    if yaml:
+        if columns:
+            click.echo("Ignoring columns provided through cli since a yaml"
+                       " file was also provided")
+        try:
+            # not found errors
+            find_yaml_files(yaml)
+        except FileNotFound:
+            click.echo("The yaml file does not exist. Exiting!")
+            return
+    elif not name:
+        click.echo("Model must have a name!")
+        return
+    profiler = Profiler() if profile else None
+    lint_issues = [] if lint else None
     try:
         # invalid definitions
-        if yaml:
-            if columns:
-                click.echo("Ignoring columns provided through cli since a yaml"
-                           " file was also provided")
-            try:
-                # not found errors
-                model_defs = get_model_defs(yaml=yaml)
-            except FileNotFound:
-                click.echo("The yaml file does not exist. Exiting!")
-                return
+        invalid = []
+        model_defs = iter_model_defs(columns=columns, name=name, yaml=yaml, errors=invalid)
+        compile_options = {}
+        if async_mode:
+            compile_options['async_mode'] = True
+        if mode != 'orm':
+            compile_options['mode'] = mode
+        if cache:
+            compile_options['cache'] = True
+        if instrument:
+            compile_options['instrument'] = True
+        options = dict(jobs=jobs, incremental=incremental, prune=prune, complete=bool(yaml),
+                       profiler=profiler, lint_issues=lint_issues, package=package, base=base, cache=cache,
+                       instrument=instrument, invalid=invalid, options=compile_options)
+        if profiler is None:
+            generate(model_defs, destination, **options)
         else:
-            if not name:
-                click.echo("Model must have a name!")
-                return
-            model_defs = get_model_defs(columns=columns, name=name)
-    except InvalidModelDefinition:
-        click.echo('All columns must have a name!')
-        return
-    for name, column_defs in model_defs.items():
-        model = ModelCompiler(name, column_defs).compiled_model
-        filename = "{}/{}.py".format(destination, ModelCompiler.convert_case(name))
+            with profiler:
+                generate(model_defs, destination, **options)
+    except InvalidModelDefinition as e:
+        raise click.ClickException("Invalid model definition: {}".format(e))
+    except yaml_module.YAMLError as e:
+        raise click.ClickException("Invalid yaml: {}".format(e))
+    finally:
+        if profiler is not None:
+            click.echo(profiler.report(), err=True)
+            if profile_output:
+                with open(profile_output, 'w') as fyle:
+                    profiler.dump_collapsed(fyle)
+        if lint_issues:
+            click.echo(format_issues(lint_issues), err=True)
+
+
+def lint_models(name, columns, yaml, lint_format, lint_fail_on, async_mode=False):
+    """Prints the lint issues of the model definitions, raises when any is at least as severe as lint_fail_on.
+    async_mode is the option the models are compiled with"""
+    if yaml:
         try:
-            # file is not writeable
-            with open(filename, 'w') as fyle:
-                click.echo("Writing {} to {}".format(name, filename))
-                fyle.write(model)
-        except IOError:
-            click.echo("The following python model was generated:\n\n{}"
-                       "Cannot write model  to {}. Make sure the "
-                       "destination is writable.\n"
-                       .format(name, filename))
+            find_yaml_files(yaml)
+        except FileNotFound:
+            raise click.ClickException("The yaml file does not exist")
+    elif not (name and columns):
+        raise click.ClickException("You must provide --yaml, or --name and --columns")
+    try:
+        issues = list(lint_model_defs(iter_model_defs(columns=columns, name=name, yaml=yaml), async_mode=async_mode))
+    except InvalidModelDefinition as e:
+        raise click.ClickException("Invalid model definition: {}".format(e))
+    except yaml_module.YAMLError as e:
+        raise click.ClickException("Invalid yaml: {}".format(e))
+    if issues or lint_format == 'json':
+        click.echo(format_issues(issues, lint_format))
+    threshold = SEVERITIES.index(lint_fail_on)
+    failing = [n for n in issues if SEVERITIES.index(n.severity) >= threshold]
+    if failing:
+        raise click.ClickException("{} lint issue(s) at or above {}".format(len(failing), lint_fail_on))
+
+
+def generate(model_defs, destination, jobs=1, incremental=False, prune=False, complete=False, profiler=None,
+             lint_issues=None, package=False, base=False, cache=False, instrument=False, invalid=None, options=None):
+    """Compiles and writes the (name, model_def) pairs of model_defs as they come in. complete
+    marks model_defs as the whole schema, i.e. recorded models missing from it were removed.
+    The lint issues of the compiled models are appended to lint_issues when it is a list.
+    package also writes the __init__ registering every model of model_defs, base the alchemy_base
+    module with Base and the engine and session factories, cache the alchemy_cache module backing
+    the get_cached of the models compiled with the cache option, instrument the alchemy_metrics
+    module the models compiled with the instrument option register with. invalid is the errors
+    list model_defs appends the invalid definitions to (see iter_yaml), they are reported as
+    failures. options are the ModelCompiler keyword arguments, they are part of the manifest
+    digests."""
+    jobs = jobs or cpu_count()
+    manifest = Manifest(destination) if incremental else None
+    digests, names, failures = {}, set(), []
+    nodes = [] if package else None
+    if base:
+        write_module(destination, 'alchemy_base', PackageCompiler().compiled_base, 'engine and session factories')
+    if cache:
+        write_module(destination, 'alchemy_cache', PackageCompiler().compiled_cache, 'cache backends')
+    if instrument:
+        write_module(destination, 'alchemy_metrics', PackageCompiler().compiled_metrics, 'metrics sinks')
+    stale = select_stale(model_defs, manifest, digests, names, nodes, options)
+    if lint_issues is not None:
+        stale = collect_lint_issues(stale, lint_issues, async_mode=(options or {}).get('async_mode', False))
+    compiled = 0
+    try:
+        for name, model, error in compile_models(stale, jobs=jobs, profiler=profiler, options=options):
+            compiled += 1
+            if error:
+                click.echo("Failed to compile {}: {}".format(name, error), err=True)
+                failures.append(name)
+                if manifest is not None:
+                    manifest.discard(name)
+                continue
+            filename = write_model(destination, name, model, only_if_changed=incremental)
+            if manifest is not None and filename:
+                manifest.update(name, digests[name], filename)
+        for name, error in invalid or ():
+            # the files of invalid models are kept rather than pruned as removed
+            click.echo("Invalid model definition {}: {}".format(name, error), err=True)
+            failures.append(name)
+            names.add(name)
+            compiled += 1
+            if manifest is not None:
+                manifest.discard(name)
+        if manifest is not None:
+            if complete:
+                if prune:
+                    for filename in manifest.prune(names):
+                        click.echo("Deleted {}".format(filename))
+                else:
+                    for name, filename in sorted(manifest.removed(names).items()):
+                        click.echo("{} is no longer defined, {} was left in place".format(name, filename))
+            click.echo("{} of {} model(s) were up to date".format(len(names) - compiled, len(names)))
+        if package:
+            write_module(destination, '__init__', PackageCompiler(nodes).compiled_package, 'package registry')
+    finally:
+        # keep what was written so far even if the schema turned out to be invalid half way
+        if manifest is not None:
+            manifest.save()
+    if failures:
+        raise click.ClickException("{} model(s) failed to compile: {}".format(len(failures), ", ".join(failures)))
+
+
+def report_load_plan(name, columns, yaml, load_plan_format):
+    """Prints the load plan of the model definitions"""
+    if yaml:
+        try:
+            find_yaml_files(yaml)
+        except FileNotFound:
+            raise click.ClickException("The yaml file does not exist")
+    elif not (name and columns):
+        raise click.ClickException("You must provide --yaml, or --name and --columns")
+    try:
+        nodes = [model_node(n, model_def) for n, model_def in iter_model_defs(columns=columns, name=name, yaml=yaml)]
+    except InvalidModelDefinition as e:
+        raise click.ClickException("Invalid model definition: {}".format(e))
+    except yaml_module.YAMLError as e:
+        raise click.ClickException("Invalid yaml: {}".format(e))
+    click.echo(format_load_plan(load_plan(nodes), load_plan_format))
 
 
 if __name__ == '__main__':
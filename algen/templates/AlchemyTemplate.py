@@ -3,6 +3,8 @@ from __future__ import print_function, unicode_literals
 from .statements import *
 from .orm import *
 from .funcs import *
+from .async_funcs import *
+from algen.profiling import ProfiledTemplate
 
 __author__ = "danishabdullah"
 
@@ -16,10 +18,35 @@ class AlchemyTemplate(object):
 
     def __init__(self):
         self.model = cls
+        self.class_section = class_section
+        self.foreign_keys_section = foreign_keys_section
+        self.relationships_section = relationships_section
+        self.proxy_cls = proxy_cls
+        self.eager_cls = eager_cls
+        self.package = package
+        self.core = core
+        self.table = table
+        self.table_alias = table_alias
+        self.record_cls = record_cls
+        self.core_column = core_column
+        self.core_foreign_key = core_foreign_key
+        self.core_partition_by = core_partition_by
+        self.base = base
+        self.cache = cache
+        self.metrics = metrics
+        self.instrumentation = instrumentation
+        self.cache_key_function = cache_key
+        self.get_cached_function = get_cached
+        self.load_option_set = load_option_set
         self.column_definition = column_definition
         self.relationship = relationship
         self.foreign_key = foreign_key
         self.foreign_key_arg = foreign_key_arg
+        self.table_args = table_args
+        self.index = index
+        self.text_clause = text_clause
+        self.deferred_column = deferred_column
+        self.partition_by = partition_by
         self.mutable_dict_type = mutable_dict_type
         self.column_arg = column_arg
         self.func_arg = func_arg
@@ -30,13 +57,48 @@ class AlchemyTemplate(object):
         self.add_function = add
         self.delete_function = delete
         self.update_function = update
+        self.bulk_params_function = bulk_params
+        self.bulk_insert_function = bulk_insert
+        self.bulk_upsert_function = bulk_upsert
+        self.iter_all_function = iter_all
+        self.light_function = light
+        self.range_partition_ddl_function = range_partition_ddl
+        self.list_partition_ddl_function = list_partition_ddl
+        self.hash_partition_ddl_function = hash_partition_ddl
+        self.with_group_function = with_group
+        self.identity_map_lookup_function = identity_map_lookup
+        self.get_many_function = get_many
+        self.exists_many_function = exists_many
+        self.exists_function = exists
+        self.statement_function = statement
+        self.key_statements_function = key_statements
+        self.update_by_pk_function = update_by_pk
+        self.delete_by_pk_function = delete_by_pk
+        self.async_add_function = async_add
+        self.async_delete_function = async_delete
+        self.async_get_function = async_get
+        self.async_get_many_function = async_get_many
+        self.async_exists_function = async_exists
+        self.async_exists_many_function = async_exists_many
+        self.async_bulk_insert_function = async_bulk_insert
         self.comparator_function = comparator
         self.representor_function = representor
         self.hash_function = hash_function
         self.col_evaluator = col_evaluator
         self.col_accessor = col_accessor
         self.to_dict_function = to_dict
+        self.to_row_function = to_row
+        self.from_row_function = from_row
         self.get_proxy_cls_function = get_proxy_cls
         self.to_proxy_function = to_proxy
+        self.to_proxies_function = to_proxies
         self.from_proxy_function = from_proxy
+        self.from_proxies_function = from_proxies
+        self.unloaded_columns_function = unloaded_columns
+        self.deferrable_to_dict_function = deferrable_to_dict
+        self.deferrable_to_row_function = deferrable_to_row
+        self.deferrable_to_proxy_function = deferrable_to_proxy
+        self.deferrable_to_proxies_function = deferrable_to_proxies
         self.key_col_comparator = key_col_comparator
+        for name, template in list(vars(self).items()):
+            setattr(self, name, ProfiledTemplate(template.template, name))
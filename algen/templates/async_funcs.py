@@ -0,0 +1,79 @@
+from __future__ import print_function, unicode_literals
+from string import Template
+
+__author__ = "danishabdullah"
+
+__all__ = ("async_add", "async_delete", "async_get", "async_get_many", "async_exists", "async_exists_many",
+           "async_bulk_insert")
+
+async_add = Template("""
+    async def async_add(self, session, flush=False):
+        # AsyncSession counterpart of add. flush sends the INSERT right away,
+        # e.g. to read server generated primary keys.
+        session.add(self)
+        if flush:
+            await session.flush([self])$invalidate_cached""")
+
+async_delete = Template("""
+    async def async_delete(self, session):
+        await session.delete(self)$invalidate_cached""")
+
+async_get = Template("""
+    @classmethod
+    async def async_get(cls, session, pk, options=()):
+        # Returns the instance for pk, a tuple in PRIMARY_KEY_NAMES order for
+        # composite keys, or None. The session identity map is looked up first.
+        return await session.get(cls, pk, options=options)""")
+
+async_get_many = Template("""
+    @classmethod
+    async def async_get_many(cls, session, pks, chunk_size=500, as_dict=False, options=()):
+        # AsyncSession counterpart of get_many. options are loader options
+        # applied to the fetched instances, e.g. $class_name.eager.with_all()
+        pks = list(pks)
+        found, missing = cls._identity_map_lookup(session, pks)
+        statement = cls._statement('get_many')
+        if options:
+            statement = statement.options(*options)
+        for start in range(0, len(missing), chunk_size):
+            chunk = missing[start:start + chunk_size]
+            result = await session.execute(statement, {'pks': chunk})
+            for obj in result.scalars().unique():
+                found[$obj_key] = obj
+        if as_dict:
+            return found
+        return [found.get(pk) for pk in pks]""")
+
+async_exists = Template("""
+    @classmethod
+    async def async_exists(cls, session, pk):
+        # AsyncSession counterpart of exists
+        if cls._identity_map_lookup(session, [pk])[0]:
+            return True
+        result = await session.execute(cls._statement('exists'), $pk_params)
+        return result.first() is not None""")
+
+async_exists_many = Template("""
+    @classmethod
+    async def async_exists_many(cls, session, pks, chunk_size=500):
+        # AsyncSession counterpart of exists_many
+        pks = list(pks)
+        found, missing = cls._identity_map_lookup(session, pks)
+        statement = cls._statement('exists_many')
+        for start in range(0, len(missing), chunk_size):
+            chunk = missing[start:start + chunk_size]
+            result = await session.execute(statement, {'pks': chunk})
+            for row in result:
+                found[$row_key] = True
+        return [pk in found for pk in pks]""")
+
+async_bulk_insert = Template("""
+    @classmethod
+    async def async_bulk_insert(cls, session, rows, batch_size=1000):
+        # AsyncSession counterpart of bulk_insert
+        statement = insert(cls.__table__)
+        count = 0
+        for batch in cls._bulk_batches(rows, batch_size):
+            await session.execute(statement, batch)
+            count += len(batch)
+        return count""")
@@ -3,36 +3,86 @@ from string import Template
 
 __author__ = "danishabdullah"
 
-__all__ = ("to_dict", "get_proxy_cls", "to_proxy", "from_proxy", "init", "add", "delete", "update", "comparator",
-           "hash_function", "representor")
+__all__ = ("cache_key", "get_cached", "range_partition_ddl", "list_partition_ddl", "hash_partition_ddl", "light",
+           "with_group", "load_option_set", "get_many", "exists_many", "exists", "statement", "key_statements",
+           "update_by_pk", "delete_by_pk", "identity_map_lookup", "iter_all", "bulk_params", "bulk_insert",
+           "bulk_upsert", "to_dict", "to_row", "from_row", "get_proxy_cls", "to_proxy", "to_proxies", "from_proxy",
+           "from_proxies", "unloaded_columns", "deferrable_to_dict", "deferrable_to_row", "deferrable_to_proxy",
+           "deferrable_to_proxies", "init", "add", "delete", "update", "comparator", "hash_function", "representor")
 
 to_dict = Template("""
     def to_dict(self):
-        return {x: y for x, y in self.__dict__.items() if not x.startswith("_sa")}""")
+        return {$dict_items}""")
+
+to_row = Template("""
+    def to_row(self):
+        return $row_tuple""")
+
+from_row = Template("""
+    @classmethod
+    def from_row(cls, row):
+        # row is any sequence with the values in COLUMN_NAMES order
+        return cls(*row)""")
 
 get_proxy_cls = Template("""
-    def get_proxy_cls(self):
-        # ${class_name}Proxy is useful when you want to persist data
-        # independent of the sqlalchemy session. It's just a namedtuple
-        # that has very low memory/cpu footprint compared the regular
-        # orm class instances.
-        keys = self.to_dict().keys()
-        name = "${class_name}Proxy"
-        return namedtuple(name, keys)""")
+    @classmethod
+    def get_proxy_cls(cls):
+        return ${class_name}Proxy""")
 
 to_proxy = Template("""
     def to_proxy(self):
         # Proxy-ing is useful when you want to persist data
-        # independent of the sqlalchemy session. It's just a namedtuple
-        # that has very low memory/cpu footprint compared the regular
-        # orm class instances.
-        cls = self._get_proxy_cls()
-        return cls(**self.to_dict())""")
+        # independent of the sqlalchemy session.
+        return ${class_name}Proxy($self_col_accessors)""")
+
+to_proxies = Template("""
+    @classmethod
+    def to_proxies(cls, instances):
+        return [${class_name}Proxy($obj_col_accessors) for obj in instances]""")
 
 from_proxy = Template("""
     @classmethod
     def from_proxy(cls, proxy):
-        return cls(**proxy._asdict())""")
+        return cls(*proxy)""")
+
+from_proxies = Template("""
+    @classmethod
+    def from_proxies(cls, proxies):
+        return [cls(*proxy) for proxy in proxies]""")
+
+unloaded_columns = Template("""
+    def _unloaded_columns(self, load_deferred):
+        # The deferred and large columns, the ones light() skips, which this
+        # instance hasn't loaded. Nothing with load_deferred, as reading them
+        # loads them, with one SELECT per instance (raising under an AsyncSession).
+        return () if load_deferred else inspect(self).unloaded.intersection($deferrable_columns)""")
+
+deferrable_to_dict = Template("""
+    def to_dict(self, load_deferred=False):
+        # Leaves out the deferred and large columns which aren't loaded, e.g.
+        # by light(), unless load_deferred.
+        unloaded = self._unloaded_columns(load_deferred)
+        return {name: getattr(self, name) for name in self.COLUMN_NAMES if name not in unloaded}""")
+
+deferrable_to_row = Template("""
+    def to_row(self, load_deferred=False):
+        # The deferred and large columns which aren't loaded, e.g. by light(),
+        # are None unless load_deferred.
+        unloaded = self._unloaded_columns(load_deferred)
+        return tuple(None if name in unloaded else getattr(self, name) for name in self.COLUMN_NAMES)""")
+
+deferrable_to_proxy = Template("""
+    def to_proxy(self, load_deferred=False):
+        # Proxy-ing is useful when you want to persist data
+        # independent of the sqlalchemy session. The deferred and large
+        # columns which aren't loaded, e.g. by light(), are None unless
+        # load_deferred.
+        return ${class_name}Proxy(*self.to_row(load_deferred))""")
+
+deferrable_to_proxies = Template("""
+    @classmethod
+    def to_proxies(cls, instances, load_deferred=False):
+        return [${class_name}Proxy(*obj.to_row(load_deferred)) for obj in instances]""")
 
 init = Template("""
     def __init__(self, $init_args):
@@ -40,19 +90,395 @@ init = Template("""
 
 add = Template("""
     def add(self, session):
-        session.add(self)""")
+        session.add(self)$invalidate_cached""")
 
 delete = Template("""
     def delete(self, session):
-        session.delete(self)""")
+        session.delete(self)$invalidate_cached""")
+
+bulk_params = Template("""
+    @classmethod
+    def _bulk_batches(cls, rows, batch_size):
+        # Rows may be dicts keyed by column name, sequences in COLUMN_NAMES
+        # order (e.g. proxies) or instances of this class. The None primary keys
+        # and None columns having a default of the latter two are left out, for
+        # the database to generate them. A batch ends early when the next row
+        # provides other columns, as all the rows of an executemany must. Dict
+        # keys which aren't COLUMN_NAMES raise a TypeError.
+        table = cls.__table__
+        omittable = frozenset(column.key for column in table.columns if column.primary_key or
+                              column.default is not None or column.server_default is not None)
+        batch, keys = [], None
+        for row in rows:
+            if isinstance(row, dict):
+                unknown = set(row).difference(cls.COLUMN_NAMES)
+                if unknown:
+                    raise TypeError("bulk row got unknown columns: {}".format(", ".join(sorted(unknown))))
+                params = dict(row)
+            else:
+                values = row.to_dict() if isinstance(row, cls) else dict(zip(cls.COLUMN_NAMES, row))
+                params = {name: value for name, value in values.items()
+                          if value is not None or name not in omittable}
+            if batch and (len(batch) >= batch_size or frozenset(params) != keys):
+                yield batch
+                batch = []
+            if not batch:
+                keys = frozenset(params)
+            batch.append(params)
+        if batch:
+            yield batch""")
+
+bulk_insert = Template("""
+    @classmethod
+    def bulk_insert(cls, session, rows, batch_size=1000):
+        # Inserts rows with one executemany per batch_size rows, bypassing the
+        # unit of work. Consecutive rows providing the same columns share one.
+        # Returns the number of rows inserted.
+        statement = insert(cls.__table__)
+        count = 0
+        for batch in cls._bulk_batches(rows, batch_size):
+            session.execute(statement, batch)
+            count += len(batch)
+        return count""")
+
+bulk_upsert = Template("""
+    @classmethod
+    def bulk_upsert(cls, session, rows, conflict_cols=None, batch_size=1000):
+        # INSERT ... ON CONFLICT (conflict_cols) DO UPDATE, one executemany per
+        # batch_size rows. conflict_cols defaults to the primary keys. Only the
+        # columns present in the rows, other than the primary keys and
+        # conflict_cols, are updated. Uses the postgresql dialect,
+        # or the sqlite one when the session is bound to sqlite.
+        # Returns the number of rows inserted or updated.
+        if conflict_cols is None:
+            conflict_cols, update_cols = cls.PRIMARY_KEY_NAMES, cls.UPDATABLE_COLUMN_NAMES
+        else:
+            update_cols = tuple(name for name in cls.UPDATABLE_COLUMN_NAMES if name not in conflict_cols)
+        dialect = session.get_bind(cls.__mapper__).dialect.name
+        insert_ = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        statements = {}
+        count = 0
+        for batch in cls._bulk_batches(rows, batch_size):
+            keys = frozenset(batch[0])
+            statement = statements.get(keys)
+            if statement is None:
+                statement = insert_(cls.__table__)
+                excluded = statement.excluded
+                set_ = {name: excluded[name] for name in update_cols if name in keys}
+                if set_:
+                    statement = statement.on_conflict_do_update(index_elements=conflict_cols, set_=set_)
+                else:
+                    statement = statement.on_conflict_do_nothing(index_elements=conflict_cols)
+                statements[keys] = statement
+            session.execute(statement, batch)
+            count += len(batch)
+        return count""")
+
+iter_all = Template("""
+    @classmethod
+    def iter_all(cls, session, batch_size=1000, where=None, yield_as=None):
+        # Streams every row ordered by the primary keys using keyset pagination,
+        # i.e. each batch is fetched with WHERE pk > last seen pk instead of an
+        # OFFSET, so the cost per batch stays constant on large tables.
+        # where is an optional filter expression. yield_as='proxy' or 'row'
+        # yields ${class_name}Proxy instances or plain tuples instead of orm
+        # instances, skipping the identity map altogether.
+        if yield_as is None:
+            entities = (cls,)
+        elif yield_as in ('proxy', 'row'):
+            entities = tuple(getattr(cls, name) for name in cls.COLUMN_NAMES)
+        else:
+            raise ValueError("yield_as must be None, 'proxy' or 'row'")
+        last_key = None
+        while True:
+            query = session.query(*entities)
+            if where is not None:
+                query = query.filter(where)
+            if last_key is not None:
+                query = query.filter($keyset_condition)
+            query = query.order_by($order_by).limit(batch_size).yield_per(batch_size)
+            last, count = None, 0
+            for last in query:
+                count += 1
+                if yield_as is None:
+                    yield last
+                elif yield_as == 'proxy':
+                    yield ${class_name}Proxy._make(last)
+                else:
+                    yield tuple(last)
+            if count < batch_size:
+                return
+            last_key = $last_key""")
+
+get_many = Template("""
+    @classmethod
+    def get_many(cls, session, pks, chunk_size=500, as_dict=False):
+        # Returns the instances for pks, looking in the session identity map
+        # first and fetching only the missing keys with one IN query per
+        # chunk_size keys. Composite keys are tuples in PRIMARY_KEY_NAMES order.
+        # Returns a list in the order of pks with None for unknown keys, or a
+        # {pk: instance} dict of the found ones when as_dict is True.
+        pks = list(pks)
+        found, missing = cls._identity_map_lookup(session, pks)
+        statement = cls._statement('get_many')
+        for start in range(0, len(missing), chunk_size):
+            chunk = missing[start:start + chunk_size]
+            for obj in session.execute(statement, {'pks': chunk}).scalars().unique():
+                found[$obj_key] = obj
+        if as_dict:
+            return found
+        return [found.get(pk) for pk in pks]""")
+
+exists_many = Template("""
+    @classmethod
+    def exists_many(cls, session, pks, chunk_size=500):
+        # Returns a list of booleans telling, in the order of pks, whether a row
+        # exists for each key. Only the primary key columns of the keys missing
+        # from the session identity map are queried, chunk_size keys at a time.
+        pks = list(pks)
+        found, missing = cls._identity_map_lookup(session, pks)
+        statement = cls._statement('exists_many')
+        for start in range(0, len(missing), chunk_size):
+            chunk = missing[start:start + chunk_size]
+            for row in session.execute(statement, {'pks': chunk}):
+                found[$row_key] = True
+        return [pk in found for pk in pks]""")
+
+exists = Template("""
+    @classmethod
+    def exists(cls, session, pk):
+        # Tells whether a row exists for pk, looking in the session identity map
+        # first. Composite keys are tuples in PRIMARY_KEY_NAMES order.
+        if cls._identity_map_lookup(session, [pk])[0]:
+            return True
+        return session.execute(cls._statement('exists'), $pk_params).first() is not None""")
+
+statement = Template("""
+    @classmethod
+    def _statement(cls, name, *args):
+        # Returns the statement built by _build_<name>(*args), once per class.
+        # Its values are bound parameters, so reusing it skips the construction
+        # of the statement and of its cache key and always hits the compiled cache.
+        statements = cls.__dict__.get('_statements')
+        if statements is None:
+            statements = {}
+            setattr(cls, '_statements', statements)
+        key = (name,) + args
+        statement = statements.get(key)
+        if statement is None:
+            statement = statements[key] = getattr(cls, '_build_' + name)(*args)
+        return statement""")
+
+key_statements = Template("""
+    @classmethod
+    def _build_get_many(cls):
+        return select(cls).where($in_condition)
+
+    @classmethod
+    def _build_exists_many(cls):
+        return select($key_columns).where($in_condition)
+
+    @classmethod
+    def _build_exists(cls):
+        return select($key_columns).where($pk_condition)""")
+
+identity_map_lookup = Template("""
+    @classmethod
+    def _identity_map_lookup(cls, session, pks):
+        # Splits pks into a {pk: instance} dict of the keys present in the
+        # session identity map and a de-duplicated list of the missing ones.
+        identity_map, mapper = session.identity_map, cls.__mapper__
+        found, missing, seen = {}, [], set()
+        for pk in pks:
+            if pk in seen:
+                continue
+            seen.add(pk)
+            obj = identity_map.get(mapper.identity_key_from_primary_key($pk_ident))
+            if obj is not None:
+                found[pk] = obj
+            else:
+                missing.append(pk)
+        return found, missing""")
+
+cache_key = Template("""
+    def cache_key(self):
+        # (table, primary key) of this instance in the read-through cache, None
+        # until it has a primary key
+        pk = $obj_key
+        return None if $pk_missing else (self.__tablename__, pk)
+
+    def invalidate_cached(self):
+        key = self.cache_key()
+        if key is not None:
+            invalidate(*key)""")
+
+get_cached = Template("""
+    @classmethod
+    def get_cached(cls, session, pk):
+        # Read-through cache of get by primary key, shared by every session of the
+        # process and holding detached ${class_name}Proxy instances. The instance in
+        # the session identity map, if any, wins as it may hold unflushed changes.
+        # Unknown keys return None and aren't cached, cached proxies hold every
+        # column, deferred ones included. Rows session wrote to in its
+        # current transaction bypass the cache, as they aren't committed yet.
+        # Entries are invalidated by add, update, delete and on commit or
+        # rollback of flushed changes, but not by bulk_insert, bulk_upsert or core
+        # statements: call cache_clear after those.
+        obj = cls._identity_map_lookup(session, [pk])[0].get(pk)
+        if obj is not None:
+            return obj.to_proxy($load_deferred)
+        if is_pending(session, cls.__tablename__, pk):
+            obj = session.get(cls, pk)
+            return None if obj is None else obj.to_proxy($load_deferred)
+        backend = get_backend(cls.__tablename__)
+        proxy = backend.get(pk)
+        if proxy is MISSING:
+            obj = session.get(cls, pk)
+            if obj is None:
+                return None
+            proxy = obj.to_proxy($load_deferred)
+            backend.set(pk, proxy)
+        return proxy
+
+    @classmethod
+    def cache_clear(cls):
+        get_backend(cls.__tablename__).clear()""")
+
+range_partition_ddl = Template("""
+    @classmethod
+    def partition_ddl(cls, start, end, interval='month'):
+        # Returns the DDL creating the partitions of ${table_name} by RANGE ($column),
+        # one per day, week, month or year from the date (or datetime) start up to
+        # end. Partitions are named ${table_name}_<lower bound>, so retention is a
+        # DROP TABLE of the expired ones:
+        #    for ddl in $class_name.partition_ddl(date(2024, 1, 1), date(2025, 1, 1)):
+        #        session.execute(text(ddl))
+        if interval not in ('day', 'week', 'month', 'year'):
+            raise ValueError("interval must be one of day, week, month or year")
+        res = []
+        lower = start
+        while lower < end:
+            if interval == 'day':
+                upper, suffix = lower + timedelta(days=1), lower.strftime('%Y_%m_%d')
+            elif interval == 'week':
+                upper, suffix = lower + timedelta(weeks=1), lower.strftime('%Y_%m_%d')
+            elif interval == 'month':
+                upper = lower.replace(year=lower.year + lower.month // 12, month=lower.month % 12 + 1, day=1)
+                suffix = lower.strftime('%Y_%m')
+            else:
+                upper, suffix = lower.replace(year=lower.year + 1, month=1, day=1), lower.strftime('%Y')
+            res.append("CREATE TABLE IF NOT EXISTS ${table_name}_{} PARTITION OF ${table_name} "
+                       "FOR VALUES FROM ('{}') TO ('{}')".format(suffix, lower.isoformat(), upper.isoformat()))
+            lower = upper
+        return res""")
+
+list_partition_ddl = Template("""
+    @classmethod
+    def partition_ddl(cls, partitions, default=True):
+        # Returns the DDL creating the partitions of ${table_name} by LIST ($column).
+        # partitions maps the partition name suffixes to the values they hold, e.g.
+        #    $class_name.partition_ddl({'eu': ['de', 'fr'], 'us': ['us']})
+        # default adds ${table_name}_default for the rows matching no partition.
+        res = ["CREATE TABLE IF NOT EXISTS ${table_name}_{} PARTITION OF ${table_name} FOR VALUES IN ({})".format(
+            suffix, ", ".join("'{}'".format(str(value).replace("'", "''")) for value in values))
+            for suffix, values in sorted(partitions.items())]
+        if default:
+            res.append("CREATE TABLE IF NOT EXISTS ${table_name}_default PARTITION OF ${table_name} DEFAULT")
+        return res""")
+
+hash_partition_ddl = Template("""
+    @classmethod
+    def partition_ddl(cls, modulus):
+        # Returns the DDL creating the modulus partitions ${table_name}_p<remainder>
+        # of ${table_name} by HASH ($column)
+        return ["CREATE TABLE IF NOT EXISTS ${table_name}_p{0} PARTITION OF ${table_name} "
+                "FOR VALUES WITH (MODULUS {1}, REMAINDER {0})".format(remainder, modulus)
+                for remainder in range(modulus)]""")
+
+light = Template("""
+    @classmethod
+    def light(cls):
+        # Loader option loading only the small columns, leaving the deferred and
+        # the large (JSON, Text, binary, ARRAY) ones to be loaded on first access:
+        #    session.query($class_name).options($class_name.light())
+        # Meant for listings; reading a skipped column costs a query per row.
+        return orm.load_only($light_columns)""")
+
+with_group = Template("""
+    @staticmethod
+    def with_group(group):
+        # Loader option loading the deferred columns of group, one of $groups,
+        # along with the rest of the row instead of on first access
+        return orm.undefer_group(group)""")
+
+load_option_set = Template("""
+    @staticmethod
+    def $set_name(strategy=None):
+        return $options""")
 
 update = Template("""
     def update(self, $update_args):
         # This function only updates a value if it is not None.
         # Falsy values go through in the normal way.
         # To set things to None use the usual syntax:
-        #    $class_name.column_name = None
-        $not_none_col_assignments""")
+        #    $class_name.column_name = None$not_none_col_assignments$invalidate_cached""")
+
+update_by_pk = Template("""
+    @classmethod
+    def update_by_pk(cls, session, pk, returning=False, **changed):
+        # Updates the row of pk with a single UPDATE, without loading it first.
+        # changed maps UPDATABLE_COLUMN_NAMES to their new values, None included.
+        # Returns the number of updated rows or, with returning, the updated row
+        # as a ${class_name}Proxy, None when there is no row for pk, read in the
+        # same round trip with RETURNING (PostgreSQL). The instance of pk in the
+        # session identity map, if any, reloads the changed columns on access.
+        unknown = set(changed).difference(cls.UPDATABLE_COLUMN_NAMES)
+        if unknown:
+            raise TypeError("update_by_pk() got unknown columns: {}".format(", ".join(sorted(unknown))))
+        if not changed:
+            raise ValueError("update_by_pk() requires at least one column to update")
+        params = $pk_bind_params
+        params.update(changed)
+        result = session.execute(cls._statement('update_by_pk', bool(returning)), params)
+        obj = cls._identity_map_lookup(session, [pk])[0].get(pk)
+        if obj is not None:
+            session.expire(obj, list(changed))$invalidate_by_pk
+        return cls._returned_proxy(result) if returning else result.rowcount
+
+    @classmethod
+    def _build_update_by_pk(cls, returning):
+        # the SET clause is rendered from the keys of the parameters
+        statement = cls.__table__.update().where($pk_bind_condition)
+        return statement.returning(*cls._returning_columns()) if returning else statement
+
+    @classmethod
+    def _returning_columns(cls):
+        table = cls.__table__
+        return [table.c[name] for name in cls.COLUMN_NAMES]
+
+    @classmethod
+    def _returned_proxy(cls, result):
+        row = result.first()
+        return None if row is None else ${class_name}Proxy._make(row)""")
+
+delete_by_pk = Template("""
+    @classmethod
+    def delete_by_pk(cls, session, pk, returning=False):
+        # Deletes the row of pk with a single DELETE, without loading it first.
+        # Returns the number of deleted rows or, with returning, the deleted row
+        # as a ${class_name}Proxy, None when there was no row for pk, read in the
+        # same round trip with RETURNING (PostgreSQL). The instance of pk in the
+        # session identity map, if any, is expunged.
+        result = session.execute(cls._statement('delete_by_pk', bool(returning)), $pk_bind_params)
+        obj = cls._identity_map_lookup(session, [pk])[0].get(pk)
+        if obj is not None:
+            session.expunge(obj)$invalidate_by_pk
+        return cls._returned_proxy(result) if returning else result.rowcount
+
+    @classmethod
+    def _build_delete_by_pk(cls, returning):
+        statement = cls.__table__.delete().where($pk_bind_condition)
+        return statement.returning(*cls._returning_columns()) if returning else statement""")
 
 comparator = Template("""
     def $func_name(self, other):
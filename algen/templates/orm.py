@@ -3,43 +3,581 @@ from string import Template
 
 __author__ = "danishabdullah"
 
-__all__ = ('cls',)
+__all__ = ('cls', 'class_section', 'foreign_keys_section', 'relationships_section', 'proxy_cls', 'eager_cls', 'core',
+           'table', 'table_alias', 'record_cls', 'package', 'base', 'cache', 'metrics', 'instrumentation')
 
 cls = Template("""from __future__ import unicode_literals, absolute_import, print_function
 
 from collections import namedtuple
 
 from sqlalchemy import Column, $types
-$orm_imports
-$named_imports
+from sqlalchemy.dialects import postgresql, sqlite$imports
 
 from .alchemy_base import Base
 
 __author__ = '$username'
 
+$proxy_cls
+
 
 class $class_name(Base):
-    __tablename__ = '$table_name'
+    __tablename__ = '$table_name'$table_args
+    COLUMN_NAMES = $column_names
+    PRIMARY_KEY_NAMES = $primary_key_names
+    UPDATABLE_COLUMN_NAMES = $updatable_column_names
+$class_body$eager_options$core_definitions$instrumentation
+""")
 
-    $column_definitions
+# Sections of the class body. Like the function templates they start with a
+# newline, so joining the non-empty ones with newlines separates them with a
+# blank line.
+class_section = Template("""
+    $section""")
 
+foreign_keys_section = Template("""
     # --- Foreign Keys ---
-    $foreign_keys
+    $foreign_keys""")
 
+relationships_section = Template("""
     # --- Relationships ---
-    $relationships
-    $init_function
-    $add_function
-    $update_function
-    $delete_function
-    $to_dict_function
-    $get_proxy_cls_function
-    $to_proxy_function
-    $from_proxy_function
-    $hash_function
-    $eq_function
-    $neq_function
-    $str_function
-    $unicode_function
-    $repr_function
+    $relationships""")
+
+proxy_cls = Template("""# ${class_name}Proxy is useful when you want to persist data independent of
+# the sqlalchemy session. It's a namedtuple, built once with the columns in
+# schema order, that has very low memory/cpu footprint compared to the
+# regular orm class instances.
+${class_name}Proxy = namedtuple('${class_name}Proxy', $proxy_fields)""")
+
+core = Template("""from __future__ import unicode_literals, absolute_import, print_function
+
+from sqlalchemy import Table, Column, $types$named_imports
+
+from .alchemy_base import Base
+
+__author__ = '$username'
+
+$table_definition$record_cls$instrumentation
 """)
+
+table = Template("""# The $table_name table, for code using sqlalchemy core directly
+${table_name}_table = Table(
+    '$table_name', Base.metadata,
+    $table_entries
+)""")
+
+table_alias = Template("""
+
+
+# The table of $class_name, for code using sqlalchemy core directly
+${table_name}_table = $class_name.__table__""")
+
+record_cls = Template("""
+
+
+class ${class_name}Record(object):
+    # Slotted record of a row of ${table_name}, a light alternative to the orm
+    # class for code executing core statements:
+    #    records = ${class_name}Record.from_rows(connection.execute(select(${table_name}_table)))
+    __slots__ = $column_names
+    # position of every column in the rows of select(${table_name}_table)
+    COLUMN_INDEXES = {$column_indexes}
+
+    def __init__(self, $init_args):
+        $col_assignments
+
+    @classmethod
+    def from_row(cls, row):
+        return cls($row_items)
+
+    @classmethod
+    def from_rows(cls, rows):
+        return [cls($row_items) for row in rows]
+
+    def to_dict(self):
+        return {$dict_items}
+
+    def to_row(self):
+        return $row_tuple
+
+    def __eq__(self, other):
+        return isinstance(other, ${class_name}Record) and self.to_row() == other.to_row()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        fields = ", ".join("{}={!r}".format(n, getattr(self, n)) for n in self.__slots__)
+        return "${class_name}Record({})".format(fields)""")
+
+eager_cls = Template("""
+
+
+class ${class_name}EagerOptions(object):
+    # Named, reusable loader option sets built from the relationships of
+    # ${class_name}, e.g.
+    #    session.query(${class_name}).options(*${class_name}.eager.with_all())
+    # Every set takes an optional strategy, one of selectin, joined, subquery
+    # or immediate, overriding the default strategy of the relationships.
+
+    @staticmethod
+    def path(path, strategy='selectin'):
+        # Returns the loader option for a dotted relationship path
+        option, owner = None, ${class_name}
+        for name in path.split('.'):
+            attr = getattr(owner, name)
+            option = getattr(orm if option is None else option, strategy + 'load')(attr)
+            owner = attr.property.mapper.class_
+        return option
+$option_sets
+
+
+${class_name}.eager = ${class_name}EagerOptions""")
+
+package = Template('''"""
+Models generated by algen. Every model is imported on first access, along with the
+models it has relationships with, instead of all of them up front:
+    from models import $example
+"""
+from __future__ import unicode_literals, absolute_import, print_function
+
+from importlib import import_module
+
+__author__ = '$username'
+
+# model name -> module
+MODELS = {
+    $models
+}
+# model name -> table
+TABLES = {
+    $tables
+}
+# model name -> names of the models it has relationships with
+RELATED = {
+    $related
+}
+# Levels of models, every model after the models whose tables it references. The
+# tables of a level can be bulk loaded in parallel, and truncated in parallel in
+# reverse level order. Models on a foreign key cycle share a level: $cycles
+LOAD_ORDER = (
+    $load_order
+)
+IMPORT_ORDER = tuple(name for level in LOAD_ORDER for name in level)
+
+__all__ = tuple(sorted(MODELS)) + ('load_all',)
+
+
+def __getattr__(name):
+    # PEP 562 module __getattr__, only called for the models not imported yet
+    try:
+        module = MODELS[name]
+    except KeyError:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    model = globals()[name] = getattr(import_module(module, __name__), name)
+    # relationships are resolved by class name once the mappers are configured
+    for related in RELATED.get(name, ()):
+        if related not in globals():
+            __getattr__(related)
+    return model
+
+
+def __dir__():
+    return sorted(set(globals()) | set(MODELS))
+
+
+def load_all():
+    # Imports every model in IMPORT_ORDER and returns them in that order, e.g.
+    # before configure_mappers() or Base.metadata.create_all()
+    return [globals().get(name) or __getattr__(name) for name in IMPORT_ORDER]
+''')
+
+base = Template('''"""
+Declarative base, engine and session factories of the models generated by algen, e.g.
+    engine = create_engine('postgresql://localhost/db')
+    Session = create_session_factory(engine)
+    ReadOnlySession = create_session_factory(engine, replica=create_engine('postgresql://replica/db'),
+                                             read_only=True)
+"""
+from __future__ import unicode_literals, absolute_import, print_function
+
+from sqlalchemy import create_engine as sqlalchemy_create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session, scoped_session, sessionmaker
+
+try:
+    from sqlalchemy.orm import declarative_base
+except ImportError:  # sqlalchemy < 1.4
+    from sqlalchemy.ext.declarative import declarative_base
+
+__author__ = '$username'
+
+Base = declarative_base()
+
+POOL_SIZE = 5
+MAX_OVERFLOW = 10
+# seconds, recycle connections before server side or firewall timeouts close them
+POOL_RECYCLE = 1800
+POOL_PRE_PING = True
+# batches the executemany of bulk_insert/bulk_upsert on psycopg2
+EXECUTEMANY_MODE = 'values_plus_batch'
+
+
+def create_engine(url, pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW, pool_recycle=POOL_RECYCLE,
+                  pool_pre_ping=POOL_PRE_PING, executemany_mode=EXECUTEMANY_MODE, **kwargs):
+    # Returns an engine for url with consistent pooling. The QueuePool settings don't
+    # apply to sqlite, which picks its own pool. Other keyword arguments are passed on
+    # to sqlalchemy's create_engine.
+    url = make_url(url)
+    if url.get_backend_name() != 'sqlite':
+        kwargs.setdefault('pool_size', pool_size)
+        kwargs.setdefault('max_overflow', max_overflow)
+        kwargs.setdefault('pool_recycle', pool_recycle)
+    kwargs.setdefault('pool_pre_ping', pool_pre_ping)
+    if executemany_mode and url.get_driver_name() == 'psycopg2':
+        kwargs.setdefault('executemany_mode', executemany_mode)
+    return sqlalchemy_create_engine(url, **kwargs)
+
+
+class RoutingSession(Session):
+    # Session sending the queries of read only sessions to the replica engine, when
+    # there is one. Flushes always go to the engine the session is bound to.
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        replica = self.info.get('replica')
+        if replica is not None and self.info.get('read_only') and not self._flushing:
+            return replica
+        return super(RoutingSession, self).get_bind(mapper, clause=clause, **kwargs)
+
+
+def create_session_factory(engine, replica=None, read_only=False, scoped=True, **kwargs):
+    # Returns a factory of sessions bound to engine, scoped to the current thread
+    # unless scoped is False. The sessions of a read_only factory read from replica.
+    # Other keyword arguments are passed on to sessionmaker.
+    factory = sessionmaker(bind=engine, class_=RoutingSession, info={'replica': replica, 'read_only': read_only},
+                           **kwargs)
+    return scoped_session(factory) if scoped else factory
+''')
+
+cache = Template('''"""
+Read-through cache of the models generated by algen with --cache, see get_cached. Every
+table gets its own backend, an in process LRUCache unless configured otherwise, e.g.
+    configure(lambda table: LRUCache(maxsize=10000, ttl=60))
+    configure(lambda table: RedisBackend(prefix=table), tables=('countries',))
+"""
+from __future__ import unicode_literals, absolute_import, print_function
+
+import threading
+from collections import OrderedDict
+from itertools import chain
+from timeit import default_timer
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+__author__ = '$username'
+
+__all__ = ('MISSING', 'CacheBackend', 'LRUCache', 'configure', 'get_backend', 'invalidate', 'invalidate_on_commit',
+           'is_pending')
+
+MISSING = object()
+# per module, as several generated packages may share a process
+_INFO_KEY = ('algen_cache_keys', __name__)
+_BACKENDS = {}
+_FACTORIES = {}
+_LOCK = threading.Lock()
+
+
+class CacheBackend(object):
+    # Interface of the cache backends, keyed by primary key. Backends of external
+    # stores (redis, memcached...) have to serialise the cached proxies themselves.
+
+    def get(self, key, default=MISSING):
+        raise NotImplementedError
+
+    def set(self, key, value):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class LRUCache(CacheBackend):
+    # Thread safe, in process, least recently used cache of at most maxsize entries
+    # which expire ttl seconds after they were set, or never when ttl is None
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=MISSING):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                return default
+            if entry[1] is not None and entry[1] < default_timer():
+                return default
+            self.entries[key] = entry
+            return entry[0]
+
+    def set(self, key, value):
+        expires = None if self.ttl is None else default_timer() + self.ttl
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (value, expires)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+def configure(factory, tables=None):
+    # Creates the backends of tables, or of every other table when tables is None,
+    # with factory(table) from now on, dropping the ones created so far
+    with _LOCK:
+        for table in tables or (None,):
+            _FACTORIES[table] = factory
+        for table in list(_BACKENDS) if tables is None else tables:
+            _BACKENDS.pop(table, None)
+
+
+def get_backend(table):
+    try:
+        return _BACKENDS[table]
+    except KeyError:
+        with _LOCK:
+            if table not in _BACKENDS:
+                factory = _FACTORIES.get(table) or _FACTORIES.get(None)
+                _BACKENDS[table] = factory(table) if factory is not None else LRUCache()
+            return _BACKENDS[table]
+
+
+def invalidate(table, pk):
+    get_backend(table).delete(pk)
+
+
+def invalidate_on_commit(session, table, pk):
+    # Invalidates (table, pk) now and again on commit of session, for the changes
+    # made by statements which bypass the unit of work
+    invalidate(table, pk)
+    session.info.setdefault(_INFO_KEY, set()).add((table, pk))
+
+
+def is_pending(session, table, pk):
+    # True when session wrote to the row of (table, pk) in its current transaction,
+    # i.e. the row session reads isn't committed and mustn't be cached
+    return (table, pk) in session.info.get(_INFO_KEY, ())
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_flushed_keys(session, flush_context):
+    # the changes only become visible to other sessions on commit, which is when
+    # their cache entries are invalidated
+    keys = session.info.setdefault(_INFO_KEY, set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        cache_key = getattr(obj, 'cache_key', None)
+        key = cache_key() if cache_key is not None else None
+        if key is not None:
+            keys.add(key)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed_keys(session):
+    for table, pk in session.info.pop(_INFO_KEY, ()):
+        invalidate(table, pk)
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _invalidate_rolled_back_keys(session, transaction):
+    # only once the outermost transaction ended without committing, as a rolled
+    # back SAVEPOINT leaves the changes of the enclosing transaction pending. The
+    # keys are invalidated rather than dropped so that no entry cached while the
+    # changes were pending outlives them.
+    if transaction.parent is None:
+        for table, pk in session.info.pop(_INFO_KEY, ()):
+            invalidate(table, pk)
+''')
+
+instrumentation = Template("""
+
+
+# Feeds the statement latency$metrics of $class_name to the
+# metrics sink of alchemy_metrics
+register('$class_name', $table$mapped)""")
+
+metrics = Template('''from __future__ import unicode_literals, absolute_import, print_function
+
+import threading
+import weakref
+from collections import defaultdict, deque
+from itertools import chain
+from timeit import default_timer
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.util import find_tables
+
+__author__ = '$username'
+
+__all__ = ('MetricsSink', 'Registry', 'configure', 'get_sink', 'register')
+
+# name of the model of every registered table and mapped class
+_TABLES = {}
+_CLASSES = {}
+# names of the models every compiled statement touches, computed once per compiled
+# statement as sqlalchemy caches and reuses them
+_STATEMENT_MODELS = weakref.WeakKeyDictionary()
+
+
+class MetricsSink(object):
+    # Interface of the metrics sinks. observe records a sample of a distribution,
+    # increment adds to a counter. The metrics fed to the sink by model are
+    # statement_seconds, the latency of every statement reading or writing the
+    # table of the model, rows_affected, the rows the INSERT, UPDATE and DELETE
+    # statements (orm and core alike) wrote as reported by cursor.rowcount, which
+    # SELECTs don't count as it's -1 for them on most DBAPIs, rows_loaded, the orm instances loaded, lazy_loads, the
+    # relationship lazy loads triggered by its instances (N+1 queries show up as
+    # many lazy_loads per statement), and flush_size, the instances per flush.
+
+    def observe(self, model, metric, value):
+        raise NotImplementedError
+
+    def increment(self, model, metric, value=1):
+        raise NotImplementedError
+
+
+class Registry(MetricsSink):
+    # Thread safe, in process, sink keeping the counters and the last max_samples
+    # samples of every distribution, which summary reduces to percentiles
+
+    def __init__(self, max_samples=10000):
+        self.max_samples = max_samples
+        self.lock = threading.Lock()
+        self.reset()
+
+    def observe(self, model, metric, value):
+        with self.lock:
+            series = self.series.get((model, metric))
+            if series is None:
+                series = self.series[(model, metric)] = [0, 0, deque(maxlen=self.max_samples)]
+            series[0] += 1
+            series[1] += value
+            series[2].append(value)
+
+    def increment(self, model, metric, value=1):
+        with self.lock:
+            self.counters[(model, metric)] += value
+
+    def reset(self):
+        with self.lock:
+            self.series = {}
+            self.counters = defaultdict(int)
+
+    def summary(self, percentiles=(50, 90, 99)):
+        # {model: {metric: counter or {count, sum, max, p<percentile>...}}}, the
+        # percentiles being those of the retained samples
+        with self.lock:
+            series = [(key, count, total, sorted(samples)) for key, (count, total, samples) in self.series.items()]
+            counters = list(self.counters.items())
+        res = defaultdict(dict)
+        for (model, metric), count, total, samples in series:
+            summary = {'count': count, 'sum': total, 'max': samples[-1]}
+            for percentile in percentiles:
+                rank = int(round(percentile / 100.0 * len(samples) + 0.5)) - 1
+                summary['p{}'.format(percentile)] = samples[min(max(rank, 0), len(samples) - 1)]
+            res[model][metric] = summary
+        for (model, metric), count in counters:
+            res[model][metric] = count
+        return dict(res)
+
+
+_SINK = Registry()
+
+
+def configure(sink):
+    # Feeds the metrics to sink from now on
+    global _SINK
+    _SINK = sink
+
+
+def get_sink():
+    return _SINK
+
+
+def register(name, table, mapped=None):
+    # Attributes the statements on table, and the loads, lazy loads and flushes of
+    # the instances of the mapped class, to the model name
+    _TABLES[table] = name
+    _STATEMENT_MODELS.clear()
+    if mapped is not None:
+        _CLASSES[mapped] = name
+
+        @event.listens_for(mapped, 'load')
+        def _count_loaded_row(target, context):
+            _SINK.increment(name, 'rows_loaded')
+
+
+def _statement_models(compiled):
+    try:
+        return _STATEMENT_MODELS[compiled]
+    except KeyError:
+        tables = find_tables(compiled.statement, include_crud=True, include_joins=True)
+        models = _STATEMENT_MODELS[compiled] = tuple(sorted(set(_TABLES[t] for t in tables if t in _TABLES)))
+        return models
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_timer(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.algen_started = default_timer()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _observe_latency(conn, cursor, statement, parameters, context, executemany):
+    if context is None or context.compiled is None:
+        return
+    started = getattr(context, 'algen_started', None)
+    if started is None:
+        return
+    elapsed = default_timer() - started
+    # only the rowcount of DML is meaningful, SELECTs report -1 on sqlite3 and
+    # server side cursors
+    rowcount = cursor.rowcount if context.isinsert or context.isupdate or context.isdelete else None
+    for model in _statement_models(context.compiled):
+        _SINK.observe(model, 'statement_seconds', elapsed)
+        if rowcount is not None and rowcount >= 0:
+            _SINK.increment(model, 'rows_affected', rowcount)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _count_lazy_load(orm_execute_state):
+    if not orm_execute_state.is_select:
+        return
+    state = orm_execute_state.lazy_loaded_from
+    if state is not None:
+        model = _CLASSES.get(state.class_)
+        if model is not None:
+            _SINK.increment(model, 'lazy_loads')
+
+
+@event.listens_for(Session, 'after_flush')
+def _observe_flush_size(session, flush_context):
+    sizes = defaultdict(int)
+    for obj in chain(session.new, session.dirty, session.deleted):
+        model = _CLASSES.get(type(obj))
+        if model is not None:
+            sizes[model] += 1
+    for model, size in sizes.items():
+        _SINK.observe(model, 'flush_size', size)
+''')
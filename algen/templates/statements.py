@@ -5,7 +5,8 @@ __author__ = "danishabdullah"
 
 __all__ = ('column_definition', 'mutable_dict_type', 'column_arg', 'func_arg', 'col_assignment', 'named_import',
            'not_none_col_assignment', 'key_col_comparator', 'col_evaluator', 'col_accessor', 'relationship',
-           'foreign_key', 'foreign_key_arg')
+           'foreign_key', 'foreign_key_arg', 'table_args', 'index', 'text_clause', 'deferred_column',
+           'partition_by', 'core_column', 'core_foreign_key', 'core_partition_by')
 
 column_definition = Template("$column_name = Column($column_type$type_params, $column_args)")
 mutable_dict_type = Template("MutableDict.as_mutable($type$type_params)")
@@ -22,3 +23,14 @@ col_accessor = Template("$col=self.$col")
 relationship = Template("$column_name = relationship('$class_name', $column_args)")
 foreign_key = Template("$column_name = Column($column_type$type_params, $foreign_key_args, $column_args)")
 foreign_key_arg = Template("ForeignKey('$reference_table.$reference_column')")
+table_args = Template("""
+    __table_args__ = (
+        $table_arg_entries,
+    )""")
+index = Template("Index('$index_name', $index_args)")
+text_clause = Template("text($sql)")
+deferred_column = Template("$column_name = deferred($column$deferred_args)")
+partition_by = Template("{'postgresql_partition_by': '$strategy ($column)'}")
+core_column = Template("Column('$column_name', $column_type$type_params, $column_args)")
+core_foreign_key = Template("Column('$column_name', $column_type$type_params, $foreign_key_args, $column_args)")
+core_partition_by = Template("postgresql_partition_by='$strategy ($column)'")
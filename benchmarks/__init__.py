@@ -0,0 +1,3 @@
+from __future__ import print_function, unicode_literals
+
+__author__ = "danishabdullah"
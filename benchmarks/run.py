@@ -0,0 +1,137 @@
+from __future__ import print_function, unicode_literals
+
+import json
+import platform
+import shutil
+import tempfile
+from os import path
+from timeit import default_timer
+
+import click
+
+from algen import __version__
+from algen.compilers import ModelCompiler
+from algen.scripts.cli import iter_yaml
+from benchmarks.synthetic import generate_schema, dump_schema
+
+__author__ = "danishabdullah"
+
+__all__ = ('COMPILE_STAGES', 'run_benchmark', 'compare_results')
+
+COMPILE_STAGES = tuple(sorted(n for n in dir(ModelCompiler) if n.startswith('compiled_') and n != 'compiled_model'))
+
+
+def _summary(timings):
+    timings = sorted(timings)
+    return {'min': timings[0], 'median': timings[len(timings) // 2], 'max': timings[-1]}
+
+
+def _time(func):
+    start = default_timer()
+    res = func()
+    return default_timer() - start, res
+
+
+def _write(destination, name, model):
+    with open(path.join(destination, "{}.py".format(ModelCompiler.convert_case(name))), 'w') as fyle:
+        fyle.write(model)
+
+
+def run_benchmark(shape, repeat=3):
+    """
+    Times every stage of generating the synthetic schema described by shape (the keyword
+    arguments of generate_schema) repeat times. Returns json serialisable results.
+    """
+    tmp = tempfile.mkdtemp(prefix='algen-bench-')
+    try:
+        schema_file = path.join(tmp, 'schema.yml')
+        with open(schema_file, 'w') as fyle:
+            dump_schema(generate_schema(**shape), fyle)
+        timings = {}
+
+        def record(stage, seconds):
+            timings.setdefault(stage, []).append(seconds)
+
+        for _ in range(repeat):
+            seconds, model_defs = _time(lambda: list(iter_yaml(schema_file)))
+            record('parse_yaml', seconds)
+            seconds, compilers = _time(lambda: [ModelCompiler(n, d) for n, d in model_defs])
+            record('construct', seconds)
+            for stage in COMPILE_STAGES:
+                seconds, _ = _time(lambda: [getattr(c, stage) for c in compilers])
+                record(stage, seconds)
+            seconds, models = _time(lambda: [(c.class_name, c.compiled_model) for c in compilers])
+            record('compiled_model', seconds)
+            seconds, _ = _time(lambda: [_write(tmp, n, m) for n, m in models])
+            record('write_files', seconds)
+    finally:
+        shutil.rmtree(tmp)
+    return {
+        'algen_version': __version__,
+        'python': platform.python_version(),
+        'shape': shape,
+        'repeat': repeat,
+        'stages': {stage: _summary(t) for stage, t in timings.items()},
+    }
+
+
+def compare_results(baseline, current, threshold=0.1, min_seconds=0.001):
+    """
+    Returns the regressions of current against baseline as a list of (stage, baseline, current)
+    median timings, for the stages which got slower by more than threshold. Stages faster than
+    min_seconds in both runs are too noisy to compare and are ignored.
+    """
+    res = []
+    for stage, timing in sorted(current['stages'].items()):
+        base = baseline['stages'].get(stage)
+        if base is None:
+            continue
+        before, after = base['median'], timing['median']
+        if max(before, after) < min_seconds:
+            continue
+        if after > before * (1 + threshold):
+            res.append((stage, before, after))
+    return res
+
+
+@click.command()
+@click.option('--models', default=500, show_default=True, help='Number of models')
+@click.option('--columns', default=12, show_default=True, help='Columns per model')
+@click.option('--fk-density', default=0.3, show_default=True, help='Probability of each foreign key')
+@click.option('--relationship-density', default=0.3, show_default=True,
+              help='Probability of a foreign key getting relationships')
+@click.option('--jsonb-ratio', default=0.1, show_default=True, help='Share of JSONB columns')
+@click.option('--array-ratio', default=0.1, show_default=True, help='Share of ARRAY columns')
+@click.option('--seed', default=0, show_default=True, help='Seed of the schema generator')
+@click.option('--repeat', default=3, show_default=True, help='Number of timed runs per stage')
+@click.option('--output', '-o', type=click.Path(), help='Write the json results to this file')
+@click.option('--compare', type=click.Path(exists=True),
+              help='Json results of a previous run. Exits with 1 when a stage regressed')
+@click.option('--threshold', default=0.1, show_default=True,
+              help='Allowed relative slowdown of a stage median before it counts as a regression')
+def cli(models, columns, fk_density, relationship_density, jsonb_ratio, array_ratio, seed, repeat, output, compare,
+        threshold):
+    shape = {'models': models, 'columns': columns, 'fk_density': fk_density,
+             'relationship_density': relationship_density, 'jsonb_ratio': jsonb_ratio,
+             'array_ratio': array_ratio, 'seed': seed}
+    results = run_benchmark(shape, repeat=repeat)
+    serialised = json.dumps(results, indent=2, sort_keys=True)
+    if output:
+        with open(output, 'w') as fyle:
+            fyle.write(serialised)
+    else:
+        click.echo(serialised)
+    if compare:
+        with open(compare, 'r') as fyle:
+            baseline = json.load(fyle)
+        if baseline.get('shape') != shape:
+            click.echo("Warning: comparing runs of different schema shapes", err=True)
+        regressions = compare_results(baseline, results, threshold=threshold)
+        for stage, before, after in regressions:
+            click.echo("Regression in {}: {:.4f}s -> {:.4f}s".format(stage, before, after), err=True)
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,79 @@
+from __future__ import print_function, unicode_literals
+
+import random
+
+import yaml
+
+try:
+    from yaml import CSafeDumper as YamlDumper
+except ImportError:
+    from yaml import SafeDumper as YamlDumper
+
+__author__ = "danishabdullah"
+
+__all__ = ('generate_schema', 'dump_schema')
+
+SCALAR_TYPES = ('Integer', 'BigInteger', 'Boolean', 'Unicode(255)', 'Unicode(20)', 'Text', 'Numeric(12, 2)',
+                'DateTime(timezone=True)', 'Date', 'Float')
+
+
+def _model_name(index):
+    return "Model{}".format(index)
+
+
+def _table_name(index):
+    return "model{}s".format(index)
+
+
+def generate_schema(models=100, columns=10, fk_density=0.3, relationship_density=0.3, jsonb_ratio=0.1,
+                    array_ratio=0.1, seed=0):
+    """
+    Returns a synthetic schema, in the same shape as the yaml files consumed by algen, with
+    `models` models of `columns` columns each. fk_density is the probability of a model
+    referencing each of up to three earlier models, relationship_density the probability of
+    a foreign key also getting a pair of relationships and jsonb_ratio/array_ratio are the
+    share of non key columns typed JSONB and ARRAY. The same seed yields the same schema.
+    """
+    rnd = random.Random(seed)
+    schema = {}
+    for index in range(models):
+        model_columns = [{'name': 'id', 'type': 'BigInteger', 'primary_key': True, 'auto_increment': True}]
+        for col in range(1, columns):
+            roll = rnd.random()
+            if roll < jsonb_ratio:
+                column = {'name': 'doc{}'.format(col), 'type': 'JSONB'}
+            elif roll < jsonb_ratio + array_ratio:
+                column = {'name': 'tags{}'.format(col), 'type': 'ARRAY(Unicode(20))'}
+            else:
+                column = {'name': 'col{}'.format(col), 'type': rnd.choice(SCALAR_TYPES)}
+                if rnd.random() < 0.1:
+                    column['index'] = True
+                if rnd.random() < 0.1:
+                    column['server_default'] = 'now()'
+            model_columns.append(column)
+        schema[_model_name(index)] = {'columns': model_columns}
+
+    for index in range(1, models):
+        targets = sorted(set(rnd.randrange(index) for _ in range(3)))
+        for target in targets:
+            if rnd.random() >= fk_density:
+                continue
+            model = schema[_model_name(index)]
+            fk_name = 'model{}_id'.format(target)
+            model.setdefault('foreign_keys', []).append(
+                {'name': fk_name, 'type': 'BigInteger', 'reference': {'table': _table_name(target), 'column': 'id'},
+                 'nullable': False})
+            if rnd.random() < relationship_density:
+                parent = schema[_model_name(target)]
+                model.setdefault('relationships', []).append(
+                    {'name': 'model{}'.format(target), 'class': _model_name(target),
+                     'back_populates': 'model{}s'.format(index)})
+                parent.setdefault('relationships', []).append(
+                    {'name': 'model{}s'.format(index), 'class': _model_name(index),
+                     'back_populates': 'model{}'.format(target)})
+    return schema
+
+
+def dump_schema(schema, fyle):
+    """Writes schema as yaml to the file like object fyle"""
+    yaml.dump(schema, fyle, Dumper=YamlDumper, default_flow_style=False, sort_keys=False)
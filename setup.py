@@ -1,4 +1,6 @@
 from __future__ import print_function, unicode_literals
+import re
+
 from setuptools import setup, find_packages
 
 __author__ = "danishabdullah"
@@ -12,10 +14,13 @@ with open("readme.md", 'r') as file:
 with open("LICENSE", 'r') as file:
     license = file.read()
 
+with open("algen/__init__.py", 'r') as file:
+    version = re.search(r'^__version__ = "(.+)"$', file.read(), re.MULTILINE).group(1)
+
 setup(
     name='algen',
-    version='1.0.3',
-    packages=find_packages(),
+    version=version,
+    packages=find_packages(exclude=('benchmarks', 'benchmarks.*', 'tests', 'tests.*')),
     url='https://github.com/danishabdullah/algen',
     install_requires=requirements,
     license=license,
@@ -0,0 +1,40 @@
+from __future__ import print_function, unicode_literals
+
+import importlib
+import os
+import sys
+from os import path
+
+from algen.compilers import ModelCompiler, PackageCompiler
+
+__author__ = "danishabdullah"
+
+__all__ = ('generate_package',)
+
+
+def generate_package(root, package, model_defs, cache=False, **options):
+    """Writes the models of model_defs, {name: model_def}, to the package directory of root, with
+    a declarative Base, alchemy_cache when cache is set and alchemy_metrics when instrument is, and
+    returns the imported package"""
+    directory = path.join(root, package)
+    os.mkdir(directory)
+    with open(path.join(directory, '__init__.py'), 'w'):
+        pass
+    with open(path.join(directory, 'alchemy_base.py'), 'w') as fyle:
+        fyle.write("from sqlalchemy.orm import declarative_base\nBase = declarative_base()\n")
+    if cache:
+        with open(path.join(directory, 'alchemy_cache.py'), 'w') as fyle:
+            fyle.write(PackageCompiler().compiled_cache)
+    if options.get('instrument'):
+        with open(path.join(directory, 'alchemy_metrics.py'), 'w') as fyle:
+            fyle.write(PackageCompiler().compiled_metrics)
+    for name, model_def in model_defs.items():
+        with open(path.join(directory, "{}.py".format(ModelCompiler.convert_case(name))), 'w') as fyle:
+            fyle.write(ModelCompiler(name, model_def, cache=cache, **options).compiled_model)
+    sys.path.insert(0, root)
+    try:
+        for name in model_defs:
+            importlib.import_module("{}.{}".format(package, ModelCompiler.convert_case(name)))
+        return importlib.import_module(package)
+    finally:
+        sys.path.remove(root)
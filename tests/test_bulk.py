@@ -0,0 +1,92 @@
+from __future__ import print_function, unicode_literals
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+
+from tests import generate_package
+
+__author__ = "danishabdullah"
+
+THING = {
+    'columns': [
+        {'name': 'id', 'type': 'Integer', 'primary_key': True, 'autoincrement': True},
+        {'name': 'email', 'type': 'Unicode(255)', 'unique': True, 'nullable': False},
+        {'name': 'status', 'type': 'Unicode(20)', 'nullable': False, 'server_default': 'new'},
+        {'name': 'name', 'type': 'Unicode(255)'},
+    ]
+}
+
+
+@pytest.fixture(scope='module')
+def thing(tmp_path_factory):
+    """Returns the Thing class generated from THING into a fresh package"""
+    package = generate_package(str(tmp_path_factory.mktemp('generated')), 'bulk_models', {'Thing': THING})
+    return package.thing.Thing
+
+
+@pytest.fixture
+def session(thing):
+    engine = create_engine('sqlite://')
+    thing.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+
+
+def rows(session, thing):
+    return [tuple(row) for row in session.execute(select(thing.__table__).order_by(thing.id))]
+
+
+def test_bulk_insert_dicts(session, thing):
+    assert thing.bulk_insert(session, [{'email': 'a@x', 'name': 'a'}, {'email': 'b@x', 'name': 'b'}]) == 2
+    assert rows(session, thing) == [(1, 'a@x', 'new', 'a'), (2, 'b@x', 'new', 'b')]
+
+
+def test_bulk_insert_instances_leave_defaults_to_the_database(session, thing):
+    instances = [thing(email='a@x', name='a'), thing(email='b@x', status='done')]
+    assert thing.bulk_insert(session, instances) == 2
+    assert rows(session, thing) == [(1, 'a@x', 'new', 'a'), (2, 'b@x', 'done', None)]
+
+
+def test_bulk_insert_tuples(session, thing):
+    assert thing.bulk_insert(session, [(None, 'a@x', None, 'a'), (7, 'b@x', 'done', 'b')], batch_size=10) == 2
+    assert rows(session, thing) == [(1, 'a@x', 'new', 'a'), (7, 'b@x', 'done', 'b')]
+
+
+def test_bulk_upsert_on_a_non_primary_key_conflict_target(session, thing):
+    thing.bulk_insert(session, [{'id': 1, 'email': 'a@x', 'name': 'a'}])
+    assert thing.bulk_upsert(session, [{'id': 42, 'email': 'a@x', 'name': 'renamed'}], conflict_cols=('email',)) == 1
+    assert rows(session, thing) == [(1, 'a@x', 'new', 'renamed')]
+
+
+class RecordingSession(object):
+    """Stands for a session bound to postgresql, recording the executed statements"""
+
+    def __init__(self):
+        self.statements = []
+
+    def get_bind(self, mapper=None):
+        return self
+
+    @property
+    def dialect(self):
+        return postgresql.dialect()
+
+    def execute(self, statement, params=None):
+        self.statements.append((statement, params))
+
+
+def test_bulk_upsert_compiles_for_postgresql(thing):
+    session = RecordingSession()
+    thing.bulk_upsert(session, [{'id': 42, 'email': 'a@x', 'name': 'a'}], conflict_cols=('email',))
+    (statement, params), = session.statements
+    sql = str(statement.compile(dialect=postgresql.dialect()))
+    assert 'ON CONFLICT (email) DO UPDATE SET name = excluded.name' in sql
+    assert params == [{'id': 42, 'email': 'a@x', 'name': 'a'}]
+
+
+def test_bulk_insert_rejects_unknown_columns(session, thing):
+    with pytest.raises(TypeError, match='unknown columns: emial'):
+        thing.bulk_insert(session, [{'emial': 'a@x', 'name': 'a'}])
+    assert rows(session, thing) == []
@@ -0,0 +1,81 @@
+from __future__ import print_function, unicode_literals
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from tests import generate_package
+
+__author__ = "danishabdullah"
+
+ACCOUNT = {
+    'columns': [
+        {'name': 'id', 'type': 'Integer', 'primary_key': True},
+        {'name': 'name', 'type': 'Unicode(255)'},
+    ]
+}
+
+
+@pytest.fixture
+def account(tmp_path):
+    return generate_package(str(tmp_path), 'cache_models_{}'.format(tmp_path.name.replace('-', '_')),
+                            {'Account': ACCOUNT}, cache=True).account.Account
+
+
+@pytest.fixture
+def engine(account, tmp_path):
+    # a file, as the sessions of an in memory database share its connection and
+    # would see each other's uncommitted changes
+    engine = create_engine('sqlite:///{}'.format(tmp_path.joinpath('cache.db')))
+    account.metadata.create_all(engine)
+    with Session(engine) as session:
+        account.bulk_insert(session, [{'id': 1, 'name': 'old'}])
+        session.commit()
+    return engine
+
+
+def cached_name(account, engine):
+    with Session(engine) as session:
+        return account.get_cached(session, 1).name
+
+
+def test_commit_invalidates(account, engine):
+    assert cached_name(account, engine) == 'old'
+    with Session(engine) as session:
+        session.get(account, 1).name = 'new'
+        session.commit()
+    assert cached_name(account, engine) == 'new'
+
+
+def test_rolled_back_savepoint_keeps_the_enclosing_invalidations(account, engine):
+    assert cached_name(account, engine) == 'old'
+    with Session(engine) as session:
+        session.get(account, 1).name = 'new'
+        session.flush()
+        savepoint = session.begin_nested()
+        session.add(account(id=2, name='other'))
+        session.flush()
+        savepoint.rollback()
+        session.commit()
+    assert cached_name(account, engine) == 'new'
+
+
+def test_rolled_back_updates_are_never_cached(account, engine):
+    with Session(engine) as session:
+        account.update_by_pk(session, 1, name='rolled back')
+        assert account.get_cached(session, 1).name == 'rolled back'
+        assert cached_name(account, engine) == 'old'
+        session.rollback()
+        assert not session.info
+    assert cached_name(account, engine) == 'old'
+
+
+def test_rolled_back_flushes_are_never_cached(account, engine):
+    with Session(engine) as session:
+        instance = session.get(account, 1)
+        instance.name = 'rolled back'
+        session.flush()
+        session.expunge(instance)
+        assert account.get_cached(session, 1).name == 'rolled back'
+        session.rollback()
+    assert cached_name(account, engine) == 'old'
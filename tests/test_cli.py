@@ -0,0 +1,51 @@
+from __future__ import print_function, unicode_literals
+
+import os
+from os import path
+
+from click.testing import CliRunner
+
+from algen.scripts.cli import cli
+
+__author__ = "danishabdullah"
+
+
+def write_schema(directory, count=20, invalid=10):
+    """Writes a schema of count models, the one at position invalid having an unknown lazy strategy"""
+    lines = []
+    for i in range(count):
+        lines.extend(["Model{}:".format(i),
+                      "  columns:",
+                      "    - name: id",
+                      "      type: Integer",
+                      "      primary_key: True"])
+        if i == invalid:
+            lines.extend(["  relationships:",
+                          "    - name: others",
+                          "      class: Model0",
+                          "      lazy: sometimes"])
+    filename = path.join(directory, 'schema.yml')
+    with open(filename, 'w') as fyle:
+        fyle.write("\n".join(lines) + "\n")
+    return filename
+
+
+def generate(schema, destination, *args):
+    os.mkdir(destination)
+    result = CliRunner().invoke(cli, ['-y', schema, '-d', destination, '--no-lint'] + list(args))
+    files = {}
+    for filename in sorted(os.listdir(destination)):
+        with open(path.join(destination, filename)) as fyle:
+            files[filename] = fyle.read()
+    return result, files
+
+
+def test_an_invalid_model_does_not_stop_the_others(tmp_path):
+    schema = write_schema(str(tmp_path))
+    serial, serial_files = generate(schema, str(tmp_path.joinpath('serial')))
+    parallel, parallel_files = generate(schema, str(tmp_path.joinpath('parallel')), '-j', '2')
+    assert serial.exit_code == parallel.exit_code == 1
+    assert "Invalid model definition Model10" in serial.output
+    assert "1 model(s) failed to compile: Model10" in parallel.output
+    assert len(serial_files) == 19 and 'model10.py' not in serial_files
+    assert parallel_files == serial_files
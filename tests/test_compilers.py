@@ -0,0 +1,23 @@
+from __future__ import print_function, unicode_literals
+
+import re
+
+import pytest
+
+from algen.compilers import ModelCompiler
+
+__author__ = "danishabdullah"
+
+ITEM = {
+    'columns': [
+        {'name': 'id', 'type': 'Integer', 'primary_key': True},
+        {'name': 'label', 'type': 'Unicode(20)'},
+    ]
+}
+
+
+@pytest.mark.parametrize('mode', ('orm', 'core', 'both'))
+def test_empty_sections_leave_no_blank_runs(mode):
+    source = ModelCompiler('Item', ITEM, mode=mode).compiled_model
+    assert not re.search(r'^[ \t]+$', source, re.MULTILINE)
+    assert '\n\n\n\n' not in source
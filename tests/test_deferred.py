@@ -0,0 +1,53 @@
+from __future__ import print_function, unicode_literals
+
+import pytest
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.orm import Session
+
+from tests import generate_package
+
+__author__ = "danishabdullah"
+
+DOCUMENT = {
+    'columns': [
+        {'name': 'id', 'type': 'Integer', 'primary_key': True},
+        {'name': 'title', 'type': 'Unicode(100)'},
+        {'name': 'body', 'type': 'Text', 'deferred': True},
+        {'name': 'payload', 'type': 'JSON'},
+    ]
+}
+
+
+@pytest.fixture(scope='module')
+def document(tmp_path_factory):
+    package = generate_package(str(tmp_path_factory.mktemp('generated')), 'deferred_models', {'Document': DOCUMENT},
+                               cache=True)
+    return package.document.Document
+
+
+@pytest.fixture
+def session(document):
+    engine = create_engine('sqlite://')
+    document.metadata.create_all(engine)
+    with Session(engine) as session:
+        document.bulk_insert(session, [{'id': 1, 'title': 'a', 'body': 'long', 'payload': {'k': 1}}])
+        session.commit()
+        statements = []
+        event.listen(engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+        session.info['statements'] = statements
+        yield session
+
+
+def test_serialising_light_instances_loads_nothing(session, document):
+    obj = session.scalars(select(document).options(document.light())).one()
+    del session.info['statements'][:]
+    assert obj.to_dict() == {'id': 1, 'title': 'a'}
+    assert obj.to_row() == (1, 'a', None, None)
+    assert document.to_proxies([obj]) == [document.get_proxy_cls()(1, 'a', None, None)]
+    assert session.info['statements'] == []
+    assert obj.to_proxy(load_deferred=True) == (1, 'a', 'long', {'k': 1})
+
+
+def test_cached_proxies_hold_the_deferred_columns(session, document):
+    document.cache_clear()
+    assert document.get_cached(session, 1) == (1, 'a', 'long', {'k': 1})
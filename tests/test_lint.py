@@ -0,0 +1,33 @@
+from __future__ import print_function, unicode_literals
+
+from algen.ir import build_model_ir
+from algen.lint import lint_model, lint_model_defs
+
+__author__ = "danishabdullah"
+
+PERSON = {
+    'columns': [{'name': 'id', 'type': 'Integer', 'primary_key': True}],
+    'relationships': [
+        {'name': 'addresses', 'class': 'Address'},
+        {'name': 'groups', 'class': 'Group', 'lazy': 'select'},
+    ]
+}
+
+
+def codes(async_mode):
+    return [(issue.code, issue.subject) for issue in lint_model(build_model_ir('Person', PERSON), async_mode)]
+
+
+def test_lazy_relationships_are_reported():
+    assert codes(async_mode=False) == [('AL005', 'addresses'), ('AL005', 'groups')]
+
+
+def test_async_mode_only_reports_declared_lazy_loading():
+    assert codes(async_mode=True) == [('AL005', 'groups')]
+
+
+def test_models_which_cannot_be_compiled_are_reported():
+    bad = {'columns': [{'name': 'id', 'type': 5, 'primary_key': True}]}
+    issues = list(lint_model_defs([('Bad', bad), ('Person', PERSON)]))
+    assert [(issue.code, issue.severity, issue.model) for issue in issues[:1]] == [('AL000', 'error', 'Bad')]
+    assert [issue.code for issue in issues[1:]] == ['AL005', 'AL005']
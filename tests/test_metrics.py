@@ -0,0 +1,29 @@
+from __future__ import print_function, unicode_literals
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from tests import generate_package
+
+__author__ = "danishabdullah"
+
+GAUGE = {
+    'columns': [
+        {'name': 'id', 'type': 'Integer', 'primary_key': True},
+        {'name': 'value', 'type': 'Integer'},
+    ]
+}
+
+
+def test_only_the_rows_written_count_as_affected(tmp_path):
+    package = generate_package(str(tmp_path), 'metrics_models', {'Gauge': GAUGE}, instrument=True)
+    gauge, sink = package.gauge.Gauge, package.alchemy_metrics.get_sink()
+    engine = create_engine('sqlite://')
+    gauge.metadata.create_all(engine)
+    with Session(engine) as session:
+        gauge.bulk_insert(session, [{'id': i, 'value': i} for i in range(3)])
+        assert len(session.scalars(select(gauge)).all()) == 3
+        gauge.update_by_pk(session, 1, value=10)
+    metrics = sink.summary()['Gauge']
+    assert (metrics['rows_affected'], metrics['rows_loaded']) == (4, 3)
+    assert 'rows_returned' not in metrics